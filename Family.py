@@ -1,11 +1,37 @@
 import streamlit as st
 import pandas as pd
+import anomaly
 import graph
+import livefeed
 import parts
-from healthdata import HealthData
-
-# データの取得
-data = HealthData()
+from healthdata import HealthData, DEFAULT_RESIDENT
+import instrument
+
+# このスクリプトの実行の計測を開始する（URLに ?debug=1 を付けるとサイドバーに結果を表示）
+instrument.start_run("Family")
+
+# センサーからのバイタルの受信（HEALTHDATA_LIVE_PORTが設定されている場合）
+livefeed.serve_from_env()
+# 異常検知（HEALTHDATA_ANOMALY_INTERVALが設定されている場合）
+anomaly.serve_from_env()
+
+# データの取得（表示する入居者はURLの ?resident=入居者ID で指定する）
+data = HealthData(resident_id=st.query_params.get("resident", DEFAULT_RESIDENT))
+data.preload((
+    "real_time_df",
+    "today_sleep_active_time_df",
+    "donut_chart_df",
+    "family_sleep_active_time_df",
+    "past_week_sleep_time_df",
+    "rader_chart_df",
+    "record_df",
+    "sleep_and_active_heatmap_df",
+    "today_wakeup_active_time_df",
+    "today_move_log_df",
+    "vital_pattern_df",
+))
+parts.select_resident(data)
+graph.use_data(data)
 
 # ダミーデータの取得
 today_sleep_time = data.get_today_sleep_time()
@@ -41,10 +67,17 @@ with col1:
 
     column_1, column_2 = st.columns(2)
 
-    with column_1:
+    # 現在の心拍数だけを一定間隔で再描画する（ページ全体やグラフは再実行しない）
+    @st.fragment(run_every=parts.live_refresh_interval())
+    def realtime_heartrate():
+      # 再描画は別スレッドで実行されるため、表示する入居者を設定し直す
+      graph.use_data(data)
       parts.display_center_text("現在の心拍数")
       fig1 = graph.heartrate_gauge()
-      st.plotly_chart(fig1, use_container_width=True, config={"displayModeBar": False})
+      parts.plotly_chart(fig1, "heartrate_gauge")
+
+    with column_1:
+      realtime_heartrate()
 
     with column_2:
       parts.display_center_text("本日の行動記録")
@@ -73,14 +106,14 @@ with col1:
     with st.container():
       parts.display_center_text("睡眠時間、室内、室外（就寝：青、室内：水色、室外：オレンジ）")
       fig2 = graph.sleep_or_active_heatmap()
-      st.plotly_chart(fig2, use_container_width=True, config={"displayModeBar": False})
+      parts.plotly_chart(fig2, "sleep_or_active_heatmap")
 
     parts.display_center_text("睡眠時間と活動時間の推移")
     column_1, column_2 = st.columns(2)
 
     with column_1:
       fig3 = graph.sleep_active_chart()
-      st.plotly_chart(fig3, use_container_width=True, config={"displayModeBar": False})
+      parts.plotly_chart(fig3, "sleep_active_chart")
 
     with column_2:
       vital_pattern_log = vital_pattern_log.replace('\n', '<br>')
@@ -100,7 +133,7 @@ with col2:
       with st.container():
           with column_1:
             fig4 = graph.rader_chart()
-            st.plotly_chart(fig4, use_container_width=True, config={"displayModeBar": False})
+            parts.plotly_chart(fig4, "rader_chart")
 
           with column_2:
               health_score_log = health_score_log.replace('\n', '<br>')
@@ -126,7 +159,10 @@ with col2:
 
       with column_2:
         fig5 = graph.donut_chart()
-        st.plotly_chart(fig5, use_container_width=True, config={"displayModeBar": False})
+        parts.plotly_chart(fig5, "donut_chart")
 
     parts.display_center_text("今月の活動記録")
     graph.time_log()
+
+# 計測結果の表示（?debug=1 の場合のみ）
+parts.debug_sidebar()
@@ -0,0 +1,65 @@
+import html
+
+import streamlit as st
+import pandas as pd
+import anomaly
+import graph
+import livefeed
+import parts
+from healthdata import HealthData, facility_overview
+import instrument
+
+# このスクリプトの実行の計測を開始する（URLに ?debug=1 を付けるとサイドバーに結果を表示）
+instrument.start_run("Overview")
+
+# ページの設定
+st.set_page_config(page_title="施設全体の見守り", page_icon=":bar_chart:", layout="wide")
+
+parts.load_css("assets/styles.css")
+
+
+# 入居者1人分のタイルのHTMLを作成する関数
+def resident_tile(row):
+    name = row["氏名"] if "氏名" in row and pd.notna(row["氏名"]) else row["入居者ID"]
+    if pd.notna(row["アラート内容"]):
+        alert = f'{html.escape(str(row["アラート内容"]))}（{pd.Timestamp(row["時刻"]).strftime("%-m/%-d %-H:%M")}）'
+    else:
+        alert = "なし"
+    danger = " tile-danger" if row["危険度"] == "危険" else ""
+    return f"""
+    <div class="resident-tile{danger}">
+        <div class="tile-name">{html.escape(str(name))}</div>
+        <div class="tile-vitals">♥ {row["心拍数"]:.0f}　呼吸 {row["呼吸数"]:.0f}</div>
+        <div class="tile-alert">最新のアラート：{alert}</div>
+        <div class="tile-fall">転倒：{row["転倒回数"]}回</div>
+    </div>
+    """
+
+
+# センサーからのバイタルの受信（HEALTHDATA_LIVE_PORTが設定されている場合）
+livefeed.serve_from_env()
+# 異常検知（HEALTHDATA_ANOMALY_INTERVALが設定されている場合）
+anomaly.serve_from_env()
+
+# 全入居者の集計（施設全体のデータを一度に集計する）
+overview = facility_overview()
+
+parts.display_header("施設全体の見守り", "#B45470")
+
+# フロアの選択（入居者一覧にフロアがある場合のみ）
+if "フロア" in overview.columns and overview["フロア"].notna().any():
+    floors = sorted(overview["フロア"].dropna().unique().tolist())
+    floor = st.selectbox("フロア", options=floors, index=0)
+    overview = overview[overview["フロア"] == floor]
+
+# タイルは1つのHTMLとしてまとめて表示する
+tiles = "".join(resident_tile(row) for _, row in overview.iterrows())
+st.markdown(f'<div class="resident-grid">{tiles}</div>', unsafe_allow_html=True)
+
+# 施設全体の異常検知ログ
+parts.display_center_text("異常検知ログ（全入居者）")
+graph.use_data(HealthData(resident_id=None))
+graph.anomaly_detect("overview")
+
+# 計測結果の表示（?debug=1 の場合のみ）
+parts.debug_sidebar()
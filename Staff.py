@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
+import anomaly
 import graph
-from healthdata import HealthData
+import livefeed
+from healthdata import HealthData, DEFAULT_RESIDENT
 import numpy as np
 import parts
+import instrument
+
+# このスクリプトの実行の計測を開始する（URLに ?debug=1 を付けるとサイドバーに結果を表示）
+instrument.start_run("Staff")
 
 # ページの設定
 st.set_page_config(page_title="スタッフ様用レイアウト", page_icon=":bar_chart:", layout="wide")
@@ -41,20 +47,35 @@ def display_large_number(number, unit="", percentage=None):
     )
 
 
-# データの取得
-data = HealthData()
-
-# ダミーデータの取得
-staff_vital_df = data.staff_vital()
-heart_rate_increase_decrease = (staff_vital_df.at[0,"今日の心拍数"] - staff_vital_df.at[0,"昨日の心拍数"]) / staff_vital_df.at[0,"昨日の心拍数"]
-
-respiratory_increase_decrease = (staff_vital_df.at[0,"今日の呼吸数"] - staff_vital_df.at[0,"昨日の呼吸数"]) / staff_vital_df.at[0,"昨日の呼吸数"]
+# センサーからのバイタルの受信（HEALTHDATA_LIVE_PORTが設定されている場合）
+livefeed.serve_from_env()
+# 異常検知（HEALTHDATA_ANOMALY_INTERVALが設定されている場合）
+anomaly.serve_from_env()
+
+# データの取得（表示する入居者はURLの ?resident=入居者ID で指定する）
+data = HealthData(resident_id=st.query_params.get("resident", DEFAULT_RESIDENT))
+data.preload((
+    "real_time_df",
+    "today_heartrate_respiratory_df",
+    "week_heartrate_respiratory_df",
+    "today_sleep_active_time_df",
+    "month_sleep_active_time_df",
+    "today_room_move_df",
+    "bet_in_out_distance_df",
+    "week_room_in_out_df",
+    "fall_down_df",
+    "staff_vital_df",
+    "month_sleep_roomout_heatmap_df",
+    "alert_log_df",
+))
+parts.select_resident(data)
+graph.use_data(data)
 
 today_wakeup_time = data.get_today_wakeup_time()
 today_sleep_time = data.get_today_sleep_time()
 
 today_room = data.get_today_room_entry_exit_count()
-today_yesterday_room = (staff_vital_df.at[0,"昨日の呼吸数"] - staff_vital_df.at[0,"昨日の心拍数"]) / staff_vital_df.at[0,"昨日の心拍数"]
+today_yesterday_room = data.get_room_entry_exit_increase_decrease()
 
 today_move = data.get_today_movement_distance()
 today_yesterday_move = data.get_movement_distance_change_ratio()
@@ -67,27 +88,37 @@ col1, col2, col3 = st.columns(3)
 # ---------------------------
 with col1:
     display_header("バイタル", "#B45470")
-    column_1, column_2 = st.columns(2)
 
-    # リアルタイムの心拍数（左）
-    with column_1:
-        display_center_text("リアルタイムの心拍数")
-        display_large_number(staff_vital_df.at[0,"今日の心拍数"], unit="", percentage=heart_rate_increase_decrease)
+    # リアルタイムの数値だけを一定間隔で再描画する（ページ全体やグラフは再実行しない）
+    @st.fragment(run_every=parts.live_refresh_interval())
+    def realtime_vitals():
+        # 昨日との比較（増減率）
+        heart_rate_increase_decrease = data.get_heart_rate_increase_decrease()
+        respiratory_increase_decrease = data.get_respiratory_increase_decrease()
 
-    # リアルタイムの呼吸数（右）
-    with column_2:
-        display_center_text("リアルタイムの呼吸数")
-        display_large_number(staff_vital_df.at[0,"今日の呼吸数"], unit="", percentage=respiratory_increase_decrease)
+        column_1, column_2 = st.columns(2)
+
+        # リアルタイムの心拍数（左）
+        with column_1:
+            display_center_text("リアルタイムの心拍数")
+            display_large_number(data.get_real_time_heart_rate(), unit="", percentage=heart_rate_increase_decrease)
+
+        # リアルタイムの呼吸数（右）
+        with column_2:
+            display_center_text("リアルタイムの呼吸数")
+            display_large_number(data.get_real_time_respiratory_rate(), unit="", percentage=respiratory_increase_decrease)
+
+    realtime_vitals()
 
     # グラフの表示
     display_center_text("1日の心拍数・呼吸数の推移")
     fig1 = graph.today_vital()
-    st.plotly_chart(fig1, use_container_width=True, config={"displayModeBar": False})
+    parts.plotly_chart(fig1, "today_vital")
 
     display_center_text("1週間の心拍数・呼吸数の推移")
     with st.container():
-        fig2 = graph.create_weekly_boxplot(identifier="boxplot_vital")
-        st.plotly_chart(fig2, use_container_width=True, config={"displayModeBar": False})
+        fig2 = graph.create_weekly_boxplot(identifier="boxplot_vital", precomputed=True)
+        parts.plotly_chart(fig2, "create_weekly_boxplot")
 
 # ---------------------------
 # カラム2：睡眠・活動時間
@@ -107,16 +138,16 @@ with col2:
     with column_2:
         display_center_text("睡眠時間・活動時間")
         fig3 = graph.sleep_time()
-        st.plotly_chart(fig3, use_container_width=True, config={"displayModeBar": False})
+        parts.plotly_chart(fig3, "sleep_time")
 
     # グラフの表示
     display_center_text("一ヶ月の睡眠時間と活動時間の内訳")
     fig4 = graph.sleep_active_area()
-    st.plotly_chart(fig4, use_container_width=True, config={"displayModeBar": False})
+    parts.plotly_chart(fig4, "sleep_active_area")
 
     display_center_text("よく眠れている日、そうでない日の可視化")
     fig5 = graph.sleep_heatmap()
-    st.plotly_chart(fig5, use_container_width=True, config={"displayModeBar": False})
+    parts.plotly_chart(fig5, "sleep_heatmap")
 
 # ---------------------------
 # カラム3：移動距離・入退室
@@ -138,11 +169,11 @@ with col3:
     # グラフの表示
     display_center_text("本日の移動距離の内訳")
     fig6 = graph.distance_graph()
-    st.plotly_chart(fig6, use_container_width=True, config={"displayModeBar": False})
+    parts.plotly_chart(fig6, "distance_graph")
 
     display_center_text("入退室の多い日・時刻")
     fig7 = graph.room_heatmap()
-    st.plotly_chart(fig7, use_container_width=True, config={"displayModeBar": False})
+    parts.plotly_chart(fig7, "room_heatmap")
 
 # ---------------------------
 # 転倒・異常検知
@@ -158,10 +189,13 @@ with st.container():
     with col1:
         display_center_text("転倒検知した日、回数")
         fig7 = graph.fall_down_heatmap()
-        st.plotly_chart(fig7, use_container_width=True,config={"displayModeBar": False})
+        parts.plotly_chart(fig7, "fall_down_heatmap")
 
     # 右列: 異常検知ログを表示
     with col2:
         display_center_text("異常検知ログ")
         # 各行の背景色を危険度で設定
         graph.anomaly_detect()
+
+# 計測結果の表示（?debug=1 の場合のみ）
+parts.debug_sidebar()
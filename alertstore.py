@@ -0,0 +1,273 @@
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+# 入居者IDの列名（healthdata.RESIDENT_COLUMNと同じ）
+RESIDENT_COLUMN = "入居者ID"
+
+# ログの列（テーブルの time, kind, severity, message の順）
+LOG_COLUMNS = ["時刻", "アラート内容", "危険度", "アラートメッセージ"]
+
+# CSVから取り込んだアラートの発生元
+CSV_ORIGIN = "csv"
+
+# 件数・絞り込みの選択肢の集計結果を保持する数（ストアごと）
+SUMMARY_CACHE_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    resident_id TEXT,
+    time INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    message TEXT,
+    origin TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_resident_time ON alerts (resident_id, time);
+CREATE INDEX IF NOT EXISTS alerts_resident_severity_time ON alerts (resident_id, severity, time);
+CREATE INDEX IF NOT EXISTS alerts_time ON alerts (time);
+CREATE INDEX IF NOT EXISTS alerts_severity_time ON alerts (severity, time);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class AlertStore:
+    """
+    異常検知のログを保存するSQLiteのストア
+
+    入居者ID・時刻・危険度の索引を持ち、期間・危険度・アラート内容での絞り込みと
+    ページ分けはSQLで行うため、ログ全体を読み込まずに必要な行だけを取り出せる。
+    時刻は1970年からの秒（タイムゾーンなし）の整数で保存する。
+    件数や絞り込みの選択肢のようにテーブルを走査する集計は、ストアの版（書き込みのたびに上がる）が
+    変わるまで結果を使い回す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._summary_lock = threading.Lock()
+        self._summaries = collections.OrderedDict()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # sqlite3の接続はスレッドをまたいで使えないため、スレッドごとに接続する
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def version(self):
+        """
+        ストアの版を返す（アラートを追加・入れ替えるたびに上がる。他のプロセスからの書き込みも含む）
+        """
+        return int(self._meta("version") or 0)
+
+    def _bump(self, db):
+        # 書き込みと同じトランザクションで版を上げる
+        db.execute("INSERT INTO meta VALUES ('version', '1') ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+    def _summary(self, key, compute):
+        # 集計結果を (集計の種類, 条件) ごとに保持し、ストアの版が同じであれば使い回す
+        version = self.version()
+        with self._summary_lock:
+            cached = self._summaries.get(key)
+            if cached is not None and cached[0] == version:
+                self._summaries.move_to_end(key)
+                return cached[1]
+        value = compute()
+        with self._summary_lock:
+            self._summaries[key] = (version, value)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+        return value
+
+    def is_synced(self, csv_path):
+        """
+        CSVのログを、前回の取り込みから変更のない状態で取り込み済みかを返す（CSVがない場合はTrue）
+        """
+        if not os.path.exists(csv_path):
+            return True
+        stat = os.stat(csv_path)
+        return self._meta("csv_stamp") == f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def has_synced(self):
+        """
+        CSVのログを一度でも取り込んだことがあるかを返す
+        """
+        return self._meta("csv_stamp") is not None
+
+    def sync(self, csv_path, parse):
+        """
+        CSVのログが前回の取り込みから変わっていれば、CSVから取り込んだ行を入れ替える
+
+        parse(バイト列) はCSVをパースしたデータフレームを返す関数。
+        更新時刻・サイズが同じであれば読み込まず、内容のハッシュが同じであればパースしない。
+        """
+        if not os.path.exists(csv_path):
+            return
+        stat = os.stat(csv_path)
+        stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+        if self._meta("csv_stamp") == stamp:
+            return
+
+        with self._write_lock:
+            if self._meta("csv_stamp") == stamp:
+                return
+            with open(csv_path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            with self._connect() as db:
+                if self._meta("csv_digest") != digest:
+                    df = parse(raw)
+                    partitioned = RESIDENT_COLUMN in df.columns
+                    db.execute("DELETE FROM alerts WHERE origin = ?", (CSV_ORIGIN,))
+                    db.executemany(
+                        "INSERT INTO alerts (resident_id, time, kind, severity, message, origin) VALUES (?, ?, ?, ?, ?, ?)",
+                        _rows(df, CSV_ORIGIN),
+                    )
+                    db.execute("INSERT OR REPLACE INTO meta VALUES ('csv_digest', ?)", (digest,))
+                    db.execute("INSERT OR REPLACE INTO meta VALUES ('partitioned', ?)", (str(int(partitioned)),))
+                    self._bump(db)
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('csv_stamp', ?)", (stamp,))
+
+    def insert(self, df, origin, cursors=None):
+        """
+        アラートを追加する（dfはログと同じ列に入居者IDの列を加えたもの）
+
+        cursorsに {名前: 値} を指定すると、アラートと同じトランザクションで保存する
+        （どこまで処理したかを記録し、再実行しても同じアラートを二重に追加しないため）。
+        """
+        with self._write_lock, self._connect() as db:
+            db.executemany(
+                "INSERT INTO alerts (resident_id, time, kind, severity, message, origin) VALUES (?, ?, ?, ?, ?, ?)",
+                _rows(df, origin),
+            )
+            if len(df):
+                self._bump(db)
+            if cursors:
+                db.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    [(f"cursor:{name}", str(value)) for name, value in cursors.items()],
+                )
+
+    def cursors(self, prefix=""):
+        """
+        insertで保存した {名前: 値} のうち、名前がprefixで始まるものを返す
+        """
+        rows = self._connect().execute(
+            "SELECT key, value FROM meta WHERE key >= ? AND key < ?",
+            (f"cursor:{prefix}", f"cursor:{prefix}\uffff"),
+        ).fetchall()
+        return {key[len("cursor:"):]: value for key, value in rows}
+
+    def _where(self, resident_id, start, end, severities, kinds):
+        # 絞り込みの条件をSQLのWHERE句とパラメータにする
+        clauses, params = [], []
+        # 入居者IDの列がないログは、どの入居者からも同じログとして参照される
+        if resident_id is not None and self._meta("partitioned") != "0":
+            clauses.append("resident_id = ?")
+            params.append(str(resident_id))
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(_seconds(pd.Timestamp(start)))
+        if end is not None:
+            clauses.append("time < ?")
+            params.append(_seconds(pd.Timestamp(end)))
+        for column, values in (("severity", severities), ("kind", kinds)):
+            if values is not None:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+                params.extend(values)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, resident_id=None, start=None, end=None, severities=None, kinds=None, limit=None, offset=0):
+        """
+        条件に合うアラートを新しい順に返す（start以上end未満、limitを指定した場合はoffset行目からlimit行）
+        """
+        where, params = self._where(resident_id, start, end, severities, kinds)
+        sql = f"SELECT resident_id, time, kind, severity, message FROM alerts{where} ORDER BY time DESC, id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        rows = self._connect().execute(sql, params).fetchall()
+        return _frame(rows, with_resident=resident_id is None and self._meta("partitioned") != "0")
+
+    def count(self, resident_id=None, start=None, end=None, severities=None, kinds=None):
+        """
+        条件に合うアラートの件数を返す
+        """
+        where, params = self._where(resident_id, start, end, severities, kinds)
+        return self._summary(
+            ("count", where, tuple(params)),
+            lambda: self._connect().execute(f"SELECT COUNT(*) FROM alerts{where}", params).fetchone()[0],
+        )
+
+    def filters(self, resident_id=None):
+        """
+        (最も古い時刻, 最も新しい時刻, 危険度の一覧, アラート内容の一覧) を返す（アラートがなければ時刻はNone）
+        """
+        where, params = self._where(resident_id, None, None, None, None)
+        return self._summary(("filters", where, tuple(params)), lambda: self._filters(where, params))
+
+    def _filters(self, where, params):
+        # 絞り込みの選択肢をテーブルから集計する
+        db = self._connect()
+        oldest, newest = db.execute(f"SELECT MIN(time), MAX(time) FROM alerts{where}", params).fetchone()
+        if oldest is None:
+            return None, None, [], []
+        severities = [r[0] for r in db.execute(f"SELECT DISTINCT severity FROM alerts{where} ORDER BY severity", params)]
+        kinds = [r[0] for r in db.execute(f"SELECT DISTINCT kind FROM alerts{where} ORDER BY kind", params)]
+        return pd.Timestamp(oldest, unit="s"), pd.Timestamp(newest, unit="s"), severities, kinds
+
+    def latest_per_resident(self):
+        """
+        入居者ごとの最新のアラートを返す
+        """
+        rows = self._connect().execute(
+            "SELECT a.resident_id, a.time, a.kind, a.severity, a.message FROM alerts a"
+            " JOIN (SELECT resident_id, MAX(time) AS time FROM alerts GROUP BY resident_id) m"
+            " ON a.resident_id IS m.resident_id AND a.time = m.time"
+            " ORDER BY a.resident_id, a.id DESC"
+        ).fetchall()
+        return _frame(rows, with_resident=True).drop_duplicates(RESIDENT_COLUMN).reset_index(drop=True)
+
+
+def _seconds(timestamp):
+    return int(timestamp.value // 10**9)
+
+
+def _rows(df, origin):
+    # データフレームの行を挿入用のタプルにする
+    # アラート内容・危険度はカテゴリー型のことがあるため、値をそのまま取り出す
+    # （空のカテゴリー型の列はastype(str)で変換できない）
+    if df.empty:
+        return []
+    residents = df[RESIDENT_COLUMN].astype(str) if RESIDENT_COLUMN in df.columns else pd.Series(None, index=df.index)
+    times = pd.to_datetime(df["時刻"]).astype("int64") // 10**9
+    return zip(
+        residents.tolist(),
+        times.tolist(),
+        df["アラート内容"].astype(object).tolist(),
+        df["危険度"].astype(object).tolist(),
+        df["アラートメッセージ"].tolist(),
+        [origin] * len(df),
+    )
+
+
+def _frame(rows, with_resident):
+    # 検索結果をログと同じ列のデータフレームにする
+    df = pd.DataFrame(rows, columns=[RESIDENT_COLUMN, *LOG_COLUMNS])
+    df["時刻"] = pd.to_datetime(df["時刻"], unit="s")
+    return df if with_resident else df.drop(columns=RESIDENT_COLUMN)
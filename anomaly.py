@@ -0,0 +1,393 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import healthdata
+import instrument
+import livefeed
+from alertstore import RESIDENT_COLUMN
+from vitalstore import VitalStore
+
+# 異常検知で作成したアラートの発生元
+ENGINE_ORIGIN = "engine"
+
+# しきい値のルール（信号, 比較, しきい値, 継続時間(秒), アラート内容, 危険度, アラートメッセージ）
+# 信号がしきい値を超えた（下回った）状態が継続時間続いた時点で、1回だけアラートを出す
+THRESHOLD_RULES = [
+    ("heart", ">", 130, 60, "頻脈", "危険", "心拍数が危険な値です。緊急対応が必要です。"),
+    ("heart", ">", 100, 300, "頻脈", "注意", "心拍数がやや高めです。様子を見てください。"),
+    ("heart", "<", 40, 60, "徐脈", "危険", "心拍数が非常に低い状態です。至急確認が必要です。"),
+    ("heart", "<", 50, 300, "徐脈", "注意", "心拍数が低めです。体調を確認してください。"),
+    ("resp", ">", 24, 300, "頻呼吸", "注意", "呼吸数が高めです。体調を確認してください。"),
+    ("resp", "<", 4, 20, "無呼吸", "危険", "無呼吸状態を検知しました。至急確認が必要です。"),
+]
+
+# 変化率のルール（信号, 変化量, 期間(秒), アラート内容, 危険度, アラートメッセージ）
+# 期間内に変化量以上増えた（減った）時点で、アラートを出す
+RATE_RULES = [
+    ("heart", 30, 60, "心拍数の急変", "注意", "心拍数が急に変化しました。様子を見てください。"),
+]
+
+# 普段の値からの外れのルール（信号, 外れの大きさ(標準偏差の何倍か), 継続時間(秒), アラート内容, 危険度, アラートメッセージ）
+# 普段の値は前日までの数日分の中央値・四分位範囲から求める
+BASELINE_RULES = [
+    ("heart", 4.0, 600, "心拍数の変化", "注意", "心拍数が普段と大きく異なります。体調を観察してください。"),
+    ("resp", 4.0, 600, "呼吸数の変化", "注意", "呼吸数が普段と大きく異なります。体調を観察してください。"),
+]
+
+# 普段の値を求める日数と、標準偏差の下限（ほとんど変動しない入居者で過敏にならないように）
+BASELINE_DAYS = 7
+BASELINE_MIN_SCALE = {"heart": 3.0, "resp": 1.0}
+
+# サンプルの間隔がこれ以上空いた場合は、状態が続いていないものとして扱う（秒）
+MAX_GAP = 60
+
+# 新しいサンプルを判定するときに、一緒に読み直す直前のサンプルの期間（秒）
+CONTEXT = max(
+    [rule[3] for rule in THRESHOLD_RULES] + [rule[2] for rule in RATE_RULES] + [rule[2] for rule in BASELINE_RULES]
+) + MAX_GAP
+
+# 1回の判定で読み込むサンプルの期間の上限（秒）
+CHUNK = 24 * 60 * 60
+
+# 長時間の不在（室外の時間が1時間のうちABSENCE_MINUTES分以上の時間帯がABSENCE_HOURS時間続いた場合）
+ABSENCE_MINUTES = 50
+ABSENCE_HOURS = 8
+ABSENCE_ALERT = ("長時間の不在", "注意", "長時間、居室の外にいます。所在を確認してください。")
+
+# 夜中の移動（NIGHT_HOURSの時間帯に入退室があった場合、入居者・日ごとに1回）
+NIGHT_HOURS = range(0, 5)
+NIGHT_ALERT = ("夜中の移動", "注意", "深夜に居室外への移動がありました。安全確認をお願いします。")
+
+ALERT_COLUMNS = [RESIDENT_COLUMN, "時刻", "アラート内容", "危険度", "アラートメッセージ"]
+
+
+def stack(series):
+    """
+    入居者ごとの (時刻, 心拍数, 呼吸数) を、入居者×サンプルの2次元配列にまとめる
+
+    時刻は1970年からの秒（float64）で、長さの足りない部分はNaNで埋める。
+    """
+    width = max((len(t) for t, _, _ in series), default=0)
+    seconds = np.full((len(series), width), np.nan)
+    signals = {"heart": np.full((len(series), width), np.nan), "resp": np.full((len(series), width), np.nan)}
+    for i, (t, heart, resp) in enumerate(series):
+        n = len(t)
+        seconds[i, :n] = np.asarray(t, dtype="datetime64[s]").astype(np.int64)
+        signals["heart"][i, :n] = heart
+        signals["resp"][i, :n] = resp
+    return seconds, signals
+
+
+def sustained(cond, seconds, duration, max_gap=MAX_GAP):
+    """
+    condがduration秒以上続いた時点（連続した区間ごとに最初の1点）をTrueにした配列を返す
+
+    cond・secondsは入居者×サンプルの配列で、すべての入居者を同時に判定する。
+    サンプルの間隔がmax_gap秒より空いた場合は、そこで区間が途切れたものとする。
+    """
+    width = cond.shape[1]
+    index = np.arange(width)
+    gap = np.zeros_like(cond)
+    with np.errstate(invalid="ignore"):
+        gap[:, 1:] = np.diff(seconds, axis=1) > max_gap
+    # 区間の開始位置（条件を満たさない点の次、または間隔の空いた点）を前方に伝える
+    marker = np.where(~cond, index + 1, np.where(gap, index, 0))
+    start = np.maximum.accumulate(marker, axis=1)
+    start_seconds = np.take_along_axis(seconds, np.minimum(start, width - 1), axis=1)
+    with np.errstate(invalid="ignore"):
+        reached = cond & (seconds - start_seconds >= duration)
+    before = np.zeros_like(reached)
+    before[:, 1:] = reached[:, :-1] & (start[:, 1:] == start[:, :-1])
+    return reached & ~before
+
+
+def _rising(cond):
+    # condがFalseからTrueに変わった点
+    before = np.zeros_like(cond)
+    before[:, 1:] = cond[:, :-1]
+    return cond & ~before
+
+
+def _shift(values, lag):
+    # lagサンプル前の値（先頭はNaN）
+    shifted = np.full_like(values, np.nan)
+    if lag < values.shape[1]:
+        shifted[:, lag:] = values[:, :-lag]
+    return shifted
+
+
+def _alerts(residents, seconds, fired, kind, severity, message):
+    # 判定結果（入居者×サンプルのTrueの位置）をアラートの行にする
+    rows, columns = np.nonzero(fired)
+    return pd.DataFrame({
+        RESIDENT_COLUMN: np.asarray(residents, dtype=object)[rows],
+        "時刻": pd.to_datetime(seconds[rows, columns].astype(np.int64), unit="s"),
+        "アラート内容": kind,
+        "危険度": severity,
+        "アラートメッセージ": message,
+    })
+
+
+def evaluate(residents, seconds, signals, baseline=None):
+    """
+    入居者×サンプルの心拍数・呼吸数をルールで判定し、アラートを時刻順に返す
+
+    residents: 入居者ID（行の順）, seconds: stackで作成した時刻の配列,
+    signals: {"heart", "resp"}: 値の配列, baseline: {"heart", "resp"}: (普段の値, 標準偏差)（入居者ごとの配列）
+    """
+    frames = []
+    with np.errstate(invalid="ignore"):
+        for signal, op, threshold, duration, *alert in THRESHOLD_RULES:
+            values = signals[signal]
+            cond = values > threshold if op == ">" else values < threshold
+            frames.append(_alerts(residents, seconds, sustained(cond, seconds, duration), *alert))
+
+        # サンプルの間隔（すべての入居者の中央値）から、期間に相当するサンプル数を求める
+        interval = np.nanmedian(np.diff(seconds, axis=1)) if seconds.shape[1] > 1 else np.nan
+        for signal, change, period, *alert in RATE_RULES:
+            if not np.isfinite(interval):
+                break
+            lag = max(1, int(round(period / interval)))
+            delta = signals[signal] - _shift(signals[signal], lag)
+            within = seconds - _shift(seconds, lag) <= period + MAX_GAP
+            frames.append(_alerts(residents, seconds, _rising((np.abs(delta) >= change) & within), *alert))
+
+        for signal, deviations, duration, *alert in BASELINE_RULES:
+            if baseline is None or signal not in baseline:
+                continue
+            center, scale = baseline[signal]
+            z = np.abs(signals[signal] - center[:, None]) / scale[:, None]
+            frames.append(_alerts(residents, seconds, sustained(z >= deviations, seconds, duration), *alert))
+
+    alerts = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ALERT_COLUMNS)
+    return alerts.sort_values(["時刻", RESIDENT_COLUMN], kind="stable", ignore_index=True)
+
+
+def evaluate_movement(sleep_active, room):
+    """
+    1時間ごとの在室状況（sleep_active_heatmap）と入退室数（room）から、長時間の不在と夜中の移動のアラートを返す
+    """
+    frames = []
+    if sleep_active is not None and len(sleep_active):
+        df = _with_resident(sleep_active)
+        hours = df["最新の一ヶ月の日付"] + pd.to_timedelta(df["時刻(hour)"] % 24, unit="h")
+        df = df.assign(時刻=hours).sort_values([RESIDENT_COLUMN, "時刻"], kind="stable")
+        codes, residents = pd.factorize(df[RESIDENT_COLUMN], sort=True)
+        position = df.groupby(codes).cumcount().to_numpy()
+        shape = (len(residents), position.max() + 1)
+        seconds = np.full(shape, np.nan)
+        outside = np.full(shape, np.nan)
+        seconds[codes, position] = df["時刻"].to_numpy().astype("datetime64[s]").astype(np.int64)
+        outside[codes, position] = df["室外（分）"].to_numpy()
+        with np.errstate(invalid="ignore"):
+            fired = sustained(outside >= ABSENCE_MINUTES, seconds, (ABSENCE_HOURS - 1) * 3600, max_gap=3600)
+        # その時間帯の終わりを、不在がABSENCE_HOURS時間続いた時刻とする
+        frames.append(_alerts(residents, seconds + 3600, fired, *ABSENCE_ALERT))
+
+    if room is not None and len(room):
+        df = _with_resident(room)
+        hour = df["時刻"] % 24
+        night = df[hour.isin(NIGHT_HOURS) & (df["入退室数"] > 0)]
+        night = night.assign(時刻=night["日付"] + pd.to_timedelta(hour[night.index], unit="h"))
+        first = night.sort_values("時刻", kind="stable").drop_duplicates([RESIDENT_COLUMN, "日付"])
+        kind, severity, message = NIGHT_ALERT
+        frames.append(first[[RESIDENT_COLUMN, "時刻"]].assign(アラート内容=kind, 危険度=severity, アラートメッセージ=message))
+
+    alerts = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ALERT_COLUMNS)
+    return alerts[ALERT_COLUMNS].sort_values(["時刻", RESIDENT_COLUMN], kind="stable", ignore_index=True)
+
+
+def _with_resident(df):
+    # 入居者IDの列がないデータは、既定の入居者のデータとして扱う
+    if RESIDENT_COLUMN in df.columns:
+        return df.assign(**{RESIDENT_COLUMN: df[RESIDENT_COLUMN].astype(str)})
+    return df.assign(**{RESIDENT_COLUMN: healthdata.DEFAULT_RESIDENT})
+
+
+class Engine:
+    """
+    高頻度のバイタルと在室状況を判定し、アラートをログのストアに追加する
+
+    入居者ごとにどの時刻まで判定したかをストアに記録し、実行のたびに新しいサンプルだけを判定する
+    （継続時間の判定のため、直前のCONTEXT秒分のサンプルも一緒に読み直す）。
+    受信サーバーで受け取っている入居者は受信したサンプルを、それ以外は保存されたセグメントを判定する。
+    """
+
+    def __init__(self, data_dir, feed=livefeed.feed):
+        self.data_dir = data_dir
+        self.feed = feed
+        self.vitals = VitalStore(os.path.join(data_dir, healthdata.VITALS_DIR))
+        # {入居者ID: (判定する日, {"heart", "resp"}: (普段の値, 標準偏差))}
+        self._baselines = {}
+        self._movement_digest = None
+
+    def _samples(self, resident_id, since, live):
+        # since（秒, Noneは最初から）より後のサンプルを、直前のCONTEXT秒分を含めて最初のサンプルからCHUNK秒分まで返す
+        start = None if since is None else np.datetime64(since - CONTEXT, "s") + np.timedelta64(1, "s")
+        if resident_id in live:
+            t, heart, resp = self.feed.window(resident_id, livefeed.CAPACITY * 5)
+            lo = 0 if start is None else np.searchsorted(t, start, side="left")
+            return t[lo:], heart[lo:], resp[lo:]
+
+        days = self.vitals.days(resident_id)
+        if start is not None:
+            days = [day for day in days if day >= str(start.astype("datetime64[D]"))]
+        parts, end = [], None
+        for day in days:
+            if end is not None and np.datetime64(day) >= end:
+                break
+            t, heart, resp = self.vitals.segment(resident_id, day).slice(start, end)
+            parts.append((t, heart, resp))
+            new = t if since is None else t[t > np.datetime64(since, "s")]
+            if end is None and len(new):
+                end = new[0] + np.timedelta64(CHUNK, "s")
+                parts[-1] = tuple(column[:np.searchsorted(t, end, side="left")] for column in parts[-1])
+        if not parts:
+            return None
+        return tuple(np.concatenate(columns) for columns in zip(*parts))
+
+    def _baseline(self, resident_id, day):
+        # 判定する日の前日までのBASELINE_DAYS日分の統計量から、普段の値と標準偏差を求める
+        cached = self._baselines.get(resident_id)
+        if cached is not None and cached[0] == day:
+            return cached[1]
+        stats = healthdata.HealthData(self.data_dir, resident_id).vital_stats()
+        values = {}
+        for signal, label in (("heart", "心拍数"), ("resp", "呼吸数")):
+            past = None if stats is None else stats[stats["日付"] < pd.Timestamp(day)].tail(BASELINE_DAYS)
+            if past is None or past.empty:
+                values[signal] = (np.nan, np.nan)
+                continue
+            spread = (past[f"{label}Q3"] - past[f"{label}Q1"]).median() / 1.349
+            values[signal] = (past[f"{label}中央値"].median(), max(spread, BASELINE_MIN_SCALE[signal]))
+        self._baselines[resident_id] = (day, values)
+        return values
+
+    def run_vitals(self, alerts):
+        """
+        前回から追加されたバイタルを判定してアラートを追加し、判定したサンプル数を返す
+        """
+        cursors = alerts.cursors("vitals:")
+        live = set(self.feed.residents())
+        residents = sorted(set(self.vitals.residents()) | live)
+        ids, series, since = [], [], []
+        for resident_id in residents:
+            previous = cursors.get(f"vitals:{resident_id}")
+            previous = None if previous is None else int(previous)
+            samples = self._samples(resident_id, previous, live)
+            if samples is None or not len(samples[0]):
+                continue
+            if previous is not None and samples[0][-1].astype(np.int64) <= previous:
+                continue
+            ids.append(resident_id)
+            series.append(samples)
+            since.append(-np.inf if previous is None else previous)
+        if not ids:
+            return 0
+
+        seconds, signals = stack(series)
+        baselines = [self._baseline(r, str(s[0][-1].astype("datetime64[D]"))) for r, s in zip(ids, series)]
+        baseline = {
+            signal: (np.array([b[signal][0] for b in baselines]), np.array([b[signal][1] for b in baselines]))
+            for signal in ("heart", "resp")
+        }
+        found = evaluate(ids, seconds, signals, baseline)
+
+        # 前回までに判定したサンプル（直前の期間として読み直した分）のアラートは除く
+        since = pd.Series(since, index=ids)
+        found = found[found["時刻"].astype("datetime64[s]").astype(np.int64) > since[found[RESIDENT_COLUMN]].to_numpy()]
+        latest = np.nanmax(seconds, axis=1).astype(np.int64)
+        alerts.insert(found, ENGINE_ORIGIN, cursors={f"vitals:{r}": int(t) for r, t in zip(ids, latest)})
+        new = (seconds > np.array(since)[:, None]).sum()
+        return int(new)
+
+    def run_movement(self, alerts):
+        """
+        在室状況・入退室数が変わっていれば判定し、前回までに追加していないアラートを追加する
+        """
+        sources = ("sleep_active_heatmap", "room")
+        present = [s for s in sources if healthdata.has_source(s, self.data_dir)]
+        digest = tuple(healthdata.source_digest(s, self.data_dir) for s in present)
+        if not present or digest == self._movement_digest:
+            return
+        frames = {s: healthdata.read_source(s, self.data_dir) if s in present else None for s in sources}
+        found = evaluate_movement(frames["sleep_active_heatmap"], frames["room"])
+
+        cursors = alerts.cursors("movement:")
+        keys = "movement:" + found[RESIDENT_COLUMN].astype(str)
+        seconds = found["時刻"].astype("datetime64[s]").astype(np.int64)
+        previous = keys.map(lambda key: int(cursors.get(key, -1)))
+        found = found[seconds > previous]
+        latest = seconds[found.index].groupby(keys[found.index]).max()
+        alerts.insert(found, ENGINE_ORIGIN, cursors=latest.to_dict())
+        self._movement_digest = digest
+
+    def run_once(self):
+        """
+        バイタルと在室状況を1回判定し、判定したバイタルのサンプル数を返す
+        """
+        alerts = healthdata.read_alerts(self.data_dir)
+        with instrument.timed("engine", "vitals"):
+            count = self.run_vitals(alerts)
+        with instrument.timed("engine", "movement"):
+            self.run_movement(alerts)
+        return count
+
+
+_engine_thread = None
+_engine_lock = threading.Lock()
+
+
+def serve(data_dir, interval):
+    """
+    interval秒ごとに判定するスレッドを起動する（起動済みの場合は何もしない）
+    """
+    global _engine_thread
+
+    def loop():
+        engine = Engine(data_dir)
+        while True:
+            started = time.monotonic()
+            try:
+                engine.run_once()
+            except Exception:
+                instrument.logger.exception("anomaly detection failed")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    with _engine_lock:
+        if _engine_thread is None:
+            _engine_thread = threading.Thread(target=loop, name="anomaly", daemon=True)
+            _engine_thread.start()
+
+
+def serve_from_env():
+    """
+    環境変数 HEALTHDATA_ANOMALY_INTERVAL（秒）が設定されていれば、その間隔で判定するスレッドを起動する
+    """
+    interval = os.environ.get("HEALTHDATA_ANOMALY_INTERVAL")
+    if interval:
+        serve(healthdata.DATA_DIR, float(interval))
+
+
+# 保存されたバイタル・在室状況をまとめて判定する（判定済みの分は判定しない）
+# 使い方: python anomaly.py [データディレクトリ]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("data_dir", nargs="?", default=healthdata.DATA_DIR)
+    args = parser.parse_args()
+
+    engine = Engine(args.data_dir)
+    start = time.perf_counter()
+    total = 0
+    while True:
+        count = engine.run_once()
+        total += count
+        if not count:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"{total} samples in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} samples/s)")
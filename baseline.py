@@ -0,0 +1,134 @@
+import threading
+
+import numpy as np
+
+# 比較に使う期間（日数）
+WINDOWS = (1, 7, 30)
+
+# 保持する日数（最も長い期間と本日の分）
+RETAIN_DAYS = max(WINDOWS) + 1
+
+
+class Welford:
+    """
+    件数・平均・偏差平方和を逐次更新する（Welfordの方法）
+
+    まとめて追加する場合も、追加分の統計量と合成する（Chanの方法）ため、1件あたりの計算量は一定。
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, values):
+        """
+        値（スカラーまたは配列）を追加する（NaNは除く）
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            mean = values.mean()
+            self.merge(Welford(len(values), mean, float(((values - mean) ** 2).sum())))
+        return self
+
+    def merge(self, other):
+        """
+        別の統計量を合成する
+        """
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        # 標本分散（2件未満の場合は0）
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+
+class RollingBaseline:
+    """
+    入居者・指標・日ごとの統計量を保持し、直近の1日・7日・30日間の平均・分散を返す
+
+    日ごとの統計量に値を足し込み、期間の統計量は日ごとの統計量を合成して求める。
+    RETAIN_DAYSより古い日の統計量は破棄する。
+    """
+
+    def __init__(self):
+        # {(入居者ID, 指標): {日付(datetime64[D]): Welford}}
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def add(self, resident_id, metric, day, values):
+        """
+        その日の値を追加する
+        """
+        day = np.datetime64(day, "D")
+        with self._lock:
+            days = self._days.setdefault((str(resident_id), metric), {})
+            state = days.get(day)
+            if state is None:
+                state = days[day] = Welford()
+                self._prune(days)
+            state.add(values)
+
+    def replace(self, resident_id, metric, day, values):
+        """
+        その日の値を入れ替える（集計し直した日の合計値など）
+        """
+        day = np.datetime64(day, "D")
+        with self._lock:
+            days = self._days.setdefault((str(resident_id), metric), {})
+            days[day] = Welford().add(values)
+            self._prune(days)
+
+    def _prune(self, days):
+        # 最新日からRETAIN_DAYSより前の日を破棄する
+        if len(days) > RETAIN_DAYS:
+            oldest = max(days) - np.timedelta64(RETAIN_DAYS - 1, "D")
+            for day in [d for d in days if d < oldest]:
+                del days[day]
+
+    def latest_day(self, resident_id, metric):
+        """
+        値のある最新日（本日として扱う日）を返す（値がなければNone）
+        """
+        with self._lock:
+            days = self._days.get((str(resident_id), metric))
+            return max(days) if days else None
+
+    def today(self, resident_id, metric):
+        """
+        最新日の統計量を返す（値がなければNone）
+        """
+        day = self.latest_day(resident_id, metric)
+        if day is None:
+            return None
+        with self._lock:
+            state = self._days[(str(resident_id), metric)][day]
+            return Welford(state.count, state.mean, state.m2)
+
+    def window(self, resident_id, metric, days=1):
+        """
+        最新日の前日までのdays日間の統計量を返す（値がなければNone）
+        """
+        latest = self.latest_day(resident_id, metric)
+        if latest is None:
+            return None
+        total = Welford()
+        with self._lock:
+            for day, state in self._days[(str(resident_id), metric)].items():
+                if latest - np.timedelta64(days, "D") <= day < latest:
+                    total.merge(state)
+        return total if total.count else None
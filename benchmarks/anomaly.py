@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import anomaly
+import healthdata
+from vitalstore import VitalStore
+
+# 高頻度のバイタルの間隔（秒）
+INTERVAL = 5
+START = np.datetime64("2024-09-30T00:00:00", "s")
+
+
+def vitals(residents, samples, seed=0):
+    """
+    入居者×サンプルの心拍数・呼吸数を作成する（10人に1人は途中で10分間の頻脈を起こす）
+    """
+    rng = np.random.default_rng(seed)
+    heart = rng.normal(75, 8, (residents, 1)) + rng.normal(0, 3, (residents, samples))
+    resp = rng.normal(16, 2, (residents, 1)) + rng.normal(0, 1, (residents, samples))
+    episode = slice(samples // 2, samples // 2 + 600 // INTERVAL)
+    heart[::10, episode] += 60
+    return heart, resp
+
+
+def measure_batch(residents, hours, repeat):
+    """
+    hours時間分のサンプルをまとめて判定する時間
+    """
+    samples = hours * 3600 // INTERVAL
+    heart, resp = vitals(residents, samples)
+    seconds = np.broadcast_to((START.astype(np.int64) + np.arange(samples) * INTERVAL).astype(np.float64), heart.shape)
+    ids = [f"R{i + 1:04d}" for i in range(residents)]
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        alerts = anomaly.evaluate(ids, seconds, {"heart": heart, "resp": resp})
+        elapsed.append(time.perf_counter() - start)
+    return {
+        "benchmark": "batch",
+        "residents": residents,
+        "samples": heart.size,
+        "alerts": len(alerts),
+        "ms": round(min(elapsed) * 1000, 3),
+        "samples_per_s": round(heart.size / min(elapsed)),
+    }
+
+
+def measure_stream(residents, ticks):
+    """
+    保存済みの1時間分に続けて、INTERVAL秒ごとに全入居者のサンプルを1件ずつ追加し、そのたびに判定する時間
+
+    1回の判定がINTERVAL秒より短ければ、受信に追いつけている。
+    """
+    history = 3600 // INTERVAL
+    heart, resp = vitals(residents, history + ticks)
+    times = START + np.arange(history + ticks) * np.timedelta64(INTERVAL, "s")
+    ids = [f"R{i + 1:04d}" for i in range(residents)]
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = VitalStore(os.path.join(data_dir, "vitals"))
+        for i, resident_id in enumerate(ids):
+            store.append(resident_id, times[:history], heart[i, :history], resp[i, :history])
+        engine = anomaly.Engine(data_dir)
+        engine.run_once()
+
+        elapsed = []
+        for tick in range(history, history + ticks):
+            for i, resident_id in enumerate(ids):
+                store.append(resident_id, times[tick:tick + 1], heart[i, tick:tick + 1], resp[i, tick:tick + 1])
+            start = time.perf_counter()
+            engine.run_once()
+            elapsed.append(time.perf_counter() - start)
+        alerts = healthdata.read_alerts(data_dir).count()
+    return {
+        "benchmark": "stream",
+        "residents": residents,
+        "ticks": ticks,
+        "alerts": alerts,
+        "ms": round(float(np.median(elapsed)) * 1000, 3),
+        "max_ms": round(max(elapsed) * 1000, 3),
+        "budget_ms": INTERVAL * 1000,
+    }
+
+
+# 異常検知の判定時間（結果は1行1件のJSONで出力する）
+# 使い方: python -m benchmarks.anomaly [--residents 50 500] [--hours 1 24] [--ticks 12]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--residents", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--hours", type=int, nargs="+", default=[1, 24])
+    parser.add_argument("--ticks", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for residents in args.residents:
+        for hours in args.hours:
+            print(json.dumps(measure_batch(residents, hours, args.repeat)), flush=True)
+        print(json.dumps(measure_stream(residents, args.ticks)), flush=True)
@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import graph
+
+WEEKDAYS = ["日曜日", "月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日"]
+
+
+def fall_grid(weeks, seed=0):
+    """
+    fall.csvと同じ形式で、weeks週分（weeks×7セル）の転倒検知データを作成する
+    """
+    rng = np.random.default_rng(seed)
+    days = weeks * 7
+    return pd.DataFrame({
+        "日付": pd.date_range("2024-01-07", periods=days, freq="D"),
+        "曜日": np.tile(WEEKDAYS, weeks),
+        "週目": np.repeat([f"{w + 1}w" for w in range(weeks)], 7),
+        "転倒検知": rng.integers(0, 10, size=days),
+    })
+
+
+def measure(weeks, repeat):
+    """
+    create_heatmap_numberの作成時間と、シリアライズした図のサイズを計測する
+    """
+    grid = fall_grid(weeks).pivot_table(index="週目", columns="曜日", values="転倒検知", aggfunc="mean")
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = graph.create_heatmap_number(grid, "", "Reds", zmax=10)
+        elapsed.append(time.perf_counter() - start)
+    return {
+        "benchmark": "create_heatmap_number",
+        "cells": weeks * 7,
+        "traces": len(fig.data),
+        "build_ms": round(min(elapsed) * 1000, 3),
+        "payload_bytes": len(fig.to_json().encode()),
+    }
+
+
+# ヒートマップの作成時間と図のサイズがセル数に対してどう増えるかを計測する
+# 使い方: python -m benchmarks.heatmap [--weeks 5 52 260] [--repeat 5]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weeks", type=int, nargs="+", default=[5, 52, 260])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for weeks in args.weeks:
+        print(json.dumps(measure(weeks, args.repeat)))
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from streamlit.testing.v1 import AppTest
+
+import graph
+import healthdata
+import synthetic
+from healthdata import HealthData
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 計測するグラフ（引数が必要なものは、ページと同じ引数を指定する）
+BUILDERS = {
+    "today_vital": (),
+    "create_weekly_boxplot": ("benchmark", None, True),
+    "sleep_time": (),
+    "sleep_active_area": (),
+    "sleep_heatmap": (),
+    "fall_down_heatmap": (),
+    "distance_graph": (),
+    "room_heatmap": (),
+    "heartrate_gauge": (),
+    "sleep_or_active_heatmap": (),
+    "sleep_active_chart": (),
+    "rader_chart": (),
+    "donut_chart": (),
+}
+
+PAGES = ["Staff.py", "Family.py"]
+
+
+def timed(fn, repeat=1, setup=None):
+    """
+    fnの実行時間（repeat回の最小値, ミリ秒）と、別に1回実行したときのピークメモリ（KB）を返す
+
+    tracemallocは実行を遅くするため、時間とメモリは別の実行で計測する。
+    """
+    elapsed = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        elapsed.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, round(min(elapsed) * 1000, 3), round(peak / 1024, 1)
+
+
+def bench_parse(data_dir, repeat):
+    """
+    データソースごとのCSVのパース時間（共有ストアを通さない）
+    """
+    for source, file_name in healthdata.SOURCES.items():
+        path = os.path.join(data_dir, file_name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        df, parse_ms, peak_kb = timed(lambda: healthdata.parse_csv(source, raw), repeat)
+        yield {"benchmark": "parse", "name": source, "rows": len(df), "bytes": len(raw), "ms": parse_ms, "peak_kb": peak_kb}
+
+
+def bench_builders(data_dir, resident_id, repeat):
+    """
+    グラフごとの作成時間と図のJSONのサイズ
+
+    データの読み込みを含めないよう一度作成してから、図のキャッシュだけを空にして計測する。
+    """
+    graph.use_data(HealthData(data_dir, resident_id))
+    for name, args in BUILDERS.items():
+        builder = getattr(graph, name)
+        builder(*args)
+        fig, build_ms, peak_kb = timed(lambda: builder(*args), repeat, setup=graph.figure_cache.clear)
+        yield {
+            "benchmark": "builder",
+            "name": name,
+            "traces": len(fig.data),
+            "payload_bytes": len(fig.to_json().encode()),
+            "ms": build_ms,
+            "peak_kb": peak_kb,
+        }
+
+
+def _clear_caches():
+    healthdata.clear_caches()
+    graph.figure_cache.clear()
+
+
+def bench_pages(data_dir, resident_id, repeat):
+    """
+    ページ全体の実行時間（ブラウザを使わずAppTestで実行する）
+
+    cold: 読み込み済みのデータと図のキャッシュを空にした状態、warm: 同じページを再実行した状態
+    """
+    healthdata.DATA_DIR = data_dir
+    for page in PAGES:
+        def run():
+            at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=600)
+            at.query_params["resident"] = resident_id
+            at.run()
+            if at.exception:
+                raise RuntimeError(f"{page}: {at.exception[0].value}")
+            return at
+
+        at, cold_ms, peak_kb = timed(run, repeat, setup=_clear_caches)
+        _, warm_ms, _ = timed(run, repeat)
+        charts = at.get("plotly_chart")
+        yield {
+            "benchmark": "page",
+            "name": page,
+            "charts": len(charts),
+            "payload_bytes": sum(len(chart.proto.spec.encode()) for chart in charts),
+            "ms": cold_ms,
+            "warm_ms": warm_ms,
+            "peak_kb": peak_kb,
+        }
+
+
+def run(residents, days, repeat, pages=True, vital_days=0, sample_rate=None):
+    """
+    合成データを作成し、パース・グラフ・ページの計測結果を順に返す
+
+    vital_daysを指定すると、sample_rate秒間隔の高頻度のバイタルも作成し、その表示を含めて計測する。
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        resident_id = synthetic.generate(data_dir, residents, days, sample_rate=sample_rate, vital_days=vital_days)[0]
+        benches = [bench_parse(data_dir, repeat), bench_builders(data_dir, resident_id, repeat)]
+        if pages:
+            benches.append(bench_pages(data_dir, resident_id, repeat))
+        for bench in benches:
+            for result in bench:
+                yield {"residents": residents, "days": days, "vital_days": vital_days, **result}
+        _clear_caches()
+
+
+def compare(baseline, current):
+    """
+    2つの計測結果（JSON Lines）を突き合わせ、時間・サイズの比（current / baseline）を返す
+    """
+    def load(path):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return {(r["benchmark"], r["name"], r["residents"], r["days"], r.get("vital_days", 0)): r for r in rows}
+
+    before, after = load(baseline), load(current)
+    for key in sorted(before.keys() & after.keys()):
+        row = dict(zip(("benchmark", "name", "residents", "days", "vital_days"), key))
+        for metric in ("ms", "warm_ms", "peak_kb", "payload_bytes"):
+            if before[key].get(metric) and metric in after[key]:
+                row[metric] = round(after[key][metric] / before[key][metric], 3)
+        yield row
+
+
+# パース・グラフ・ページの計測（結果は1行1件のJSONで出力する）
+# 高頻度のバイタルは --vital-days に1以上を指定した場合に --sample-rate 秒間隔で作成する
+# 使い方: python -m benchmarks.suite [--residents 1 50 500] [--days 1 30 365] [--vital-days 0 1] [--sample-rate 5] [--repeat 3] [--no-pages]
+#         python -m benchmarks.suite --compare 前回の結果.jsonl 今回の結果.jsonl
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--residents", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 30, 365])
+    parser.add_argument("--vital-days", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--sample-rate", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-pages", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    args = parser.parse_args()
+
+    if args.compare:
+        results = compare(*args.compare)
+    else:
+        results = (
+            result
+            for residents in args.residents
+            for days in args.days
+            for vital_days in args.vital_days
+            for result in run(
+                residents, days, args.repeat, pages=not args.no_pages,
+                vital_days=vital_days, sample_rate=args.sample_rate if vital_days else None,
+            )
+        )
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
@@ -0,0 +1,84 @@
+import collections
+import functools
+import json
+import threading
+
+import plotly.graph_objects as go
+
+
+class FigureCache:
+    """
+    シリアライズしたPlotlyの図（JSON）を保持するLRUキャッシュ
+
+    図はキー（どの図か）ごとに最新の版の1つだけを保持し、版が変わった図は置き換える
+    （受信中のデータのように版が頻繁に変わる図でも、古い版の図がキャッシュを占めない）。
+    保持する図の数はmaxsizeまでで、超えた場合は最も長く使われていない図から破棄する。
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._figures = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def get(self, key, build, version=None):
+        """
+        keyに対応する版がversionの図を返す（キャッシュになければbuild()で作成して保存する）
+        """
+        with self._lock:
+            cached = self._figures.get(key)
+            spec = cached[1] if cached is not None and cached[0] == version else None
+            if spec is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if spec is not None:
+            # 保存済みの図は検証済みのため、再検証せずに復元する
+            return go.Figure(json.loads(spec), _validate=False)
+
+        fig = build()
+        spec = fig.to_json()
+        with self._lock:
+            self._figures[key] = (version, spec)
+            self._figures.move_to_end(key)
+            self._evict()
+        return fig
+
+    def resize(self, maxsize):
+        """
+        保持する図の数の上限を変える
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        # 上限を超えた分を、最も長く使われていない図から破棄する
+        while len(self._figures) > self.maxsize:
+            self._figures.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+
+def cached_figure(cache, version, scope=lambda: None):
+    """
+    図を作成する関数を (関数名, 引数, scope()) をキーに、version()を版としてキャッシュするデコレータ
+
+    versionは元データの版を返す関数で、データが更新されると版が変わり図が作り直される。
+    scopeは図の対象（入居者など）を返す関数で、対象ごとに別の図として保持する。
+    """
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(*args, **kwargs):
+            key = (build.__name__, args, tuple(sorted(kwargs.items())), scope())
+            return cache.get(key, lambda: build(*args, **kwargs), version())
+        return wrapper
+    return decorator
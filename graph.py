@@ -3,9 +3,13 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.io as pio
 import streamlit as st
+import threading
 from healthdata import HealthData
 import matplotlib.pyplot as plt
 import plotly.express as px
+import figcache
+import instrument
+import occupancy
 
 # Plotlyのデフォルトテーマをライトモードに設定
 pio.templates.default = "plotly_white"
@@ -17,20 +21,85 @@ HEIGHT = 350
 MARGIN_FAMILY = dict(l=40, r=20, t=20, b=20)
 HEIGHT_FAMILY = 250
 
-data = HealthData()
+# 入居者を指定しない場合に表示するデータ
+default_data = HealthData()
 
+# 表示中の入居者のデータ（Streamlitはセッションごとに別スレッドでスクリプトを実行するため、スレッドごとに保持する）
+_local = threading.local()
+
+def use_data(data):
+    """
+    このスレッドで作成するグラフの元データ（入居者）を切り替える
+    """
+    _local.data = data
+
+def current_data():
+    """
+    このスレッドで表示中の入居者のデータを返す
+    """
+    return getattr(_local, "data", default_data)
+
+def empty_figure(height=HEIGHT, margin=MARGIN):
+    """
+    表示する入居者のデータがない場合の空の図を作成する関数
+    """
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        annotations=[dict(text="データがありません", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)],
+        height=height,
+        margin=margin,
+    )
+    return fig
+
+# 作成した図のキャッシュ（元データの版が変わらない限り図を作り直さない）
+# 図は入居者ごとに保持するため、上限は表示する入居者の数に合わせて広げる（fit_figure_cache）
+FIGURE_CACHE_SIZE = 64
+figure_cache = figcache.FigureCache(maxsize=FIGURE_CACHE_SIZE)
+
+# キャッシュする図の種類の数（cached_figureを付けた関数の数）
+_cached_builders = 0
+
+def _figure_scope():
+    # 図の対象（データディレクトリと入居者）
+    data = current_data()
+    return data.data_dir, data.resident_id
+
+def cached_figure(*datasets):
+    """
+    datasetsの版を図の版として、入居者ごとに図をキャッシュするデコレータ
+    """
+    global _cached_builders
+    _cached_builders += 1
+    cache = figcache.cached_figure(figure_cache, lambda: current_data().version(*datasets), _figure_scope)
+
+    # キャッシュから返した場合も含めて、図を返すまでの時間を計測する
+    def decorator(fn):
+        return instrument.timer("builder")(cache(fn))
+    return decorator
+
+def fit_figure_cache(residents):
+    """
+    全入居者の図を保持できるよう、キャッシュの上限を入居者の数に合わせて広げる
+    """
+    # 同じ図を引数を変えて作る場合（指標の切り替えなど）の分も見込む
+    size = max(FIGURE_CACHE_SIZE, 2 * _cached_builders * residents)
+    if size > figure_cache.maxsize:
+        figure_cache.resize(size)
+
+@cached_figure("today_heartrate_respiratory_df", "stored_vitals")
 def today_vital():
     """
     1日の心拍数・呼吸数の推移をプロットする関数
     """
-    df = data.get_today_heartrate_respiratory()
-    time = df["時間"]
-    respiration_rate = df["呼吸数"]
-    heart_rate = df["心拍数"]
+    time, heart_rate, respiration_rate = current_data().get_today_heartrate_respiratory()
 
-    # 各データの平均値
-    avg_respiration = respiration_rate.mean()
-    avg_heart_rate = heart_rate.mean()
+    # 各データの平均値・最大値（最大値の点にだけ値を表示する）
+    avg_respiration = np.nanmean(respiration_rate)
+    avg_heart_rate = np.nanmean(heart_rate)
+    max_respiration = np.nanmax(respiration_rate)
+    max_heart_rate = np.nanmax(heart_rate)
 
     # 図の作成
     fig = go.Figure()
@@ -42,7 +111,7 @@ def today_vital():
         name="呼吸数",
         line=dict(color="skyblue", width=4),
         marker=dict(size=8, color="skyblue"),
-        text=[f"{int(y)}" if y == respiration_rate.max() else "" for y in respiration_rate],
+        text=[f"{int(y)}" if y == max_respiration else "" for y in respiration_rate],
         textposition="top center",
     ))
 
@@ -53,7 +122,7 @@ def today_vital():
         name="心拍数",
         line=dict(color="orange", width=4),
         marker=dict(size=8, color="orange"),
-        text=[f"{int(y)}" if y == heart_rate.max() else "" for y in heart_rate],
+        text=[f"{int(y)}" if y == max_heart_rate else "" for y in heart_rate],
         textposition="top center",
     ))
 
@@ -69,9 +138,13 @@ def today_vital():
             text=f"(平均) {avg:.1f}", showarrow=False, font=dict(color=color)
         )
 
-    # レイアウトの設定
+    # レイアウトの設定（高頻度のデータは時刻軸で表示する）
+    if np.issubdtype(time.dtype, np.datetime64):
+        xaxis = dict(tickformat="%-H:%M")
+    else:
+        xaxis = dict(tickmode='linear', tick0=0, dtick=1)
     fig.update_layout(
-        xaxis=dict(tickmode='linear', tick0=0, dtick=1),
+        xaxis=xaxis,
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
         font=dict(color="black"),
         paper_bgcolor="white",
@@ -82,11 +155,10 @@ def today_vital():
 
     return fig
 
-def create_weekly_boxplot(identifier):
+def create_weekly_boxplot(identifier, days=None, precomputed=False):
     """
     1週間の心拍数・呼吸数のボックスプロットを作成する関数
     """
-    df = data.get_weekly_heartrate_respiratory()
     selectbox_key = f"selectbox_{identifier}"
 
     selected_metric = st.selectbox(
@@ -96,24 +168,49 @@ def create_weekly_boxplot(identifier):
         key=selectbox_key
     )
 
+    return weekly_boxplot(selected_metric, days, precomputed)
+
+@cached_figure("week_heartrate_respiratory_df", "stored_vitals")
+def weekly_boxplot(selected_metric, days=None, precomputed=False):
+    """
+    選択された指標の日ごとのボックスプロットを作成する関数
+
+    days: 直近何日分を表示するか（省略時は全期間）
+    precomputed: Trueの場合、最小値・Q1・中央値・Q3・最大値の列をそのまま箱の統計量として使う
+    （Falseの場合は5つの値から箱の統計量をPlotly側で計算する）
+    どちらの場合も期間の長さによらずトレースは1つだけ作成する。
+    """
+    df = current_data().get_weekly_heartrate_respiratory()
+    if days is not None:
+        df = df.tail(days)
+
     columns_mapping = {
         "心拍数": ["心拍数最小値", "心拍数Q1", "心拍数中央値", "心拍数Q3", "心拍数最大値"],
         "呼吸数": ["呼吸数最小値", "呼吸数Q1", "呼吸数中央値", "呼吸数Q3", "呼吸数最大値"]
     }
     selected_columns = columns_mapping[selected_metric]
+    marker_color = "pink" if selected_metric == "心拍数" else "lightblue"
+    dates = df["日付"].to_numpy()
 
     # ボックスプロットの作成
-    fig = go.Figure()
-
-    for i, date in enumerate(df["日付"]):
-        values = df.loc[i, selected_columns]
-        fig.add_trace(
-            go.Box(
-                y=values,
-                name=date,
-                marker_color="pink" if selected_metric == "心拍数" else "lightblue"
-            )
+    if precomputed:
+        low, q1, median, q3, high = (df[column].to_numpy() for column in selected_columns)
+        box = go.Box(
+            x=dates,
+            lowerfence=low,
+            q1=q1,
+            median=median,
+            q3=q3,
+            upperfence=high,
+            marker_color=marker_color
         )
+    else:
+        box = go.Box(
+            x=np.repeat(dates, len(selected_columns)),
+            y=df[selected_columns].to_numpy().ravel(),
+            marker_color=marker_color
+        )
+    fig = go.Figure(data=[box])
 
     # レイアウト設定
     fig.update_layout(
@@ -126,11 +223,12 @@ def create_weekly_boxplot(identifier):
 
     return fig
 
+@cached_figure("today_sleep_active_time_df")
 def sleep_time():
     """
     今日と昨日の睡眠時間と活動時間の比較を横棒グラフで表示する関数
     """
-    df = data.get_today_yesterday_sleep_active()
+    df = current_data().get_today_yesterday_sleep_active()
 
     categories = ["今日","昨日"]
     sleep_hours = [df.at[0, "昨日の睡眠時間"], df.at[0, "本日の睡眠時間"]]
@@ -176,13 +274,13 @@ def sleep_time():
 
     return fig
 
+@cached_figure("month_sleep_active_time_df")
 def sleep_active_area():
     """
     1ヶ月の睡眠時間と活動時間の内訳をエリアチャートで表示する関数
     """
 
-    df = data.get_monthly_sleep_active()
-    df["日付_再計算"] = pd.to_datetime(df["日付"],format="%Y-%m-%d").dt.strftime("%-m/%-d")
+    df = current_data().get_monthly_sleep_active()
     dates = df["日付_再計算"]
     sleep_hours = df["睡眠時間"]
     active_hours = df["活動時間"]
@@ -223,15 +321,16 @@ def sleep_active_area():
 
     return fig
 
-def create_heatmap(df, value_col, title, colorscale, zmax):
+def create_heatmap(grid, title, colorscale, zmax):
     """
     ヒートマップを作成する共通関数
+
+    grid: 週目×曜日の集計値（HealthData.get_calendar_grid）
     """
-    pivot_table = df.pivot_table(index="週目", columns="曜日", values=value_col, aggfunc="mean")
-    pivot_table = pivot_table.loc[::-1]  # 週目の順序を逆にする
+    pivot_table = grid.loc[::-1]  # 週目の順序を逆にする
 
     ordered_columns = ["日曜日", "月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日"]
-    pivot_table = pivot_table[ordered_columns]
+    pivot_table = pivot_table.reindex(columns=ordered_columns)  # データのない曜日も列として表示する
 
     fig = go.Figure(data=go.Heatmap(
         z=pivot_table.values,
@@ -276,20 +375,32 @@ def create_heatmap(df, value_col, title, colorscale, zmax):
 
     return fig
 
-def create_heatmap_number(df, value_col, title, colorscale, zmax):
+def create_heatmap_number(grid, title, colorscale, zmax):
     """
     ヒートマップを作成する共通関数
+
+    grid: 週目×曜日の集計値（HealthData.get_calendar_grid）
     """
-    pivot_table = df.pivot_table(index="週目", columns="曜日", values=value_col, aggfunc="mean")
-    pivot_table = pivot_table.loc[::-1]  # 週目の順序を逆にする
+    pivot_table = grid.loc[::-1]  # 週目の順序を逆にする
 
     ordered_columns = ["日曜日", "月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日"]
-    pivot_table = pivot_table[ordered_columns]
+    pivot_table = pivot_table.reindex(columns=ordered_columns)  # データのない曜日も列として表示する
+
+    # 各セルに数値を表示（セルごとにトレースを追加せず、ヒートマップ自身のテキストとして描画する）
+    values = pivot_table.values
+    text_values = np.where(
+        np.isnan(values),
+        "",
+        np.nan_to_num(values).astype(int).astype(str)
+    )
 
     fig = go.Figure(data=go.Heatmap(
-        z=pivot_table.values,
+        z=values,
         x=pivot_table.columns,
         y=pivot_table.index,
+        text=text_values,
+        texttemplate="%{text}",
+        textfont=dict(size=12, color="black"),
         colorscale=colorscale,
         zmin=0,
         zmax=zmax,
@@ -297,26 +408,6 @@ def create_heatmap_number(df, value_col, title, colorscale, zmax):
         showscale=False
     ))
 
-    # 各セルに数値を表示
-    text_values = np.where(
-        np.isnan(pivot_table.values),
-        "",
-        pivot_table.values.astype(int)
-    )
-
-    for i, row in enumerate(text_values):
-        for j, val in enumerate(row):
-            if val != "":
-                fig.add_trace(go.Scatter(
-                    x=[ordered_columns[j]],
-                    y=[pivot_table.index[i]],
-                    text=str(val),
-                    mode="text",
-                    textfont=dict(size=12, color="black"),
-                    showlegend=False,
-                    hoverinfo="none"
-                ))
-
     # レイアウトの調整
     fig.update_layout(
         title=title,
@@ -329,38 +420,41 @@ def create_heatmap_number(df, value_col, title, colorscale, zmax):
 
     return fig
 
+@cached_figure("month_sleep_roomout_heatmap_df")
 def sleep_heatmap():
     """
     よく眠れている日、そうでない日の可視化をヒートマップで表示する関数
     """
-    df = data.month_sleep_roomout_heatmap()
+    grid = current_data().get_calendar_grid("sleep", "睡眠時間")
     colorscale = [
         [0, "lightgray"],
         [0.01, "lightblue"],
         [1, "deepskyblue"]
     ]
-    fig = create_heatmap(df, "睡眠時間", "週目", colorscale, zmax=500)
+    fig = create_heatmap(grid, "週目", colorscale, zmax=500)
     return fig
 
+@cached_figure("fall_down_df")
 def fall_down_heatmap():
     """
     転倒検知をヒートマップで表示する関数
     """
-    df = data.get_fall_detection_data()
+    grid = current_data().get_calendar_grid("fall", "転倒検知")
     colorscale = [
         [0, "lightgray"],
         [0.01, "rgb(255,255,204)"],
         [0.5, "rgb(252,141,89)"],
         [1, "rgb(215,48,39)"]
     ]
-    fig = create_heatmap_number(df, "転倒検知", "", colorscale, zmax=10)
+    fig = create_heatmap_number(grid, "", colorscale, zmax=10)
     return fig
 
+@cached_figure("bet_in_out_distance_df")
 def distance_graph():
     """
     ベッド内・ベッド外の移動距離をプロットする関数
     """
-    df = data.get_movement_distance_breakdown()
+    df = current_data().get_movement_distance_breakdown()
     time_labels = df["時刻"]
     bed_inside = df["ベッド内移動距離"]
     bed_outside = df["ベッド外移動距離"]
@@ -406,13 +500,12 @@ def distance_graph():
 
     return fig
 
+@cached_figure("week_room_in_out_df")
 def room_heatmap():
     """
     入退室数をヒートマップで表示する関数
     """
-    df = data.get_weekly_room_entry_exit()
-    pivot_table = df.pivot(index="日付_再調整", columns="時刻", values="入退室数")
-    pivot_table = pivot_table.loc[::-1]
+    pivot_table = current_data().get_room_entry_exit_grid().loc[::-1]
 
     fig = go.Figure(data=go.Heatmap(
         z=pivot_table.values,
@@ -437,15 +530,59 @@ def room_heatmap():
 
     return fig
 
-def anomaly_detect():
+# 異常検知のログの1ページあたりの行数
+ALERT_PAGE_SIZE = 100
+
+def anomaly_detect(identifier="anomaly", page_size=ALERT_PAGE_SIZE):
     """
     異常検知のログを表示する関数
+
+    期間・危険度・アラート内容で絞り込み、新しい順にpage_size行ずつ表示する。
+    スタイルは表示するページにだけ適用するため、ログの件数によらず表示にかかる時間は一定になる。
     """
-    df = data.get_alert_log()
-    df = df.sort_values(by=["時刻"],ascending=False)
-    
+    data = current_data()
+    oldest, newest, severities, kinds = data.get_alert_filters()
+    if oldest is None:
+        st.info("異常検知のログはありません")
+        return
+
+    col1, col2, col3 = st.columns([2, 1, 2])
+    with col1:
+        period = st.date_input(
+            "期間",
+            value=(oldest.date(), newest.date()),
+            min_value=oldest.date(),
+            max_value=newest.date(),
+            key=f"{identifier}_period",
+        )
+    with col2:
+        selected_severities = st.multiselect("危険度", severities, default=severities, key=f"{identifier}_severity")
+    with col3:
+        selected_kinds = st.multiselect("アラート内容", kinds, default=kinds, key=f"{identifier}_kind")
+
+    # 終了日を選択中の間は開始日だけが返る
+    start = period[0] if len(period) > 0 else None
+    end = period[1] if len(period) > 1 else None
+    # すべて選択されている条件は絞り込まない（時刻の索引で検索できるようにするため）
+    filters = dict(
+        start=start,
+        end=end,
+        severities=None if set(selected_severities) == set(severities) else selected_severities,
+        kinds=None if set(selected_kinds) == set(kinds) else selected_kinds,
+    )
+    total = data.count_alerts(**filters)
+
+    # 絞り込みで件数が減った場合は、表示中のページを最後のページに合わせる
+    pages = max((total - 1) // page_size + 1, 1)
+    page_key = f"{identifier}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input("ページ", min_value=1, max_value=pages, step=1, key=page_key)
+    df = data.get_alert_page(page - 1, page_size, **filters)
+    st.caption(f"全{total}件中 {(page - 1) * page_size + min(len(df), 1)}〜{(page - 1) * page_size + len(df)}件")
+
     # 行のハイライト
-    styled_log_data = df.style.apply(highlight_danger, axis=1)
+    styled_log_data = df.style.apply(highlight_danger, axis=None)
     
     # ヘッダーのスタイルを設定
     styled_log_data = styled_log_data.set_table_styles(
@@ -461,18 +598,25 @@ def anomaly_detect():
     )
 
     # DataFrameをStreamlitで表示
-    st.dataframe(styled_log_data, height=400, width=700, hide_index=True)
+    with instrument.timed("emit", "anomaly_detect"):
+        st.dataframe(styled_log_data, height=400, width=700, hide_index=True)
 
-def highlight_danger(row):
+def highlight_danger(df):
     """
-    危険度が「危険」の場合に行をハイライトする関数
+    危険度が「危険」の行をハイライトする関数（表示するページ全体に一度に適用する）
     """
-    return ['background-color: lightcoral' if row["危険度"] == "危険" else '' for _ in row]
+    danger = np.broadcast_to((df["危険度"] == "危険").to_numpy()[:, None], df.shape)
+    return pd.DataFrame(
+        np.where(danger, "background-color: lightcoral", ""),
+        index=df.index,
+        columns=df.columns,
+    )
 
 
+@cached_figure("real_time_df", "vitals")
 def heartrate_gauge():
         # データ設定
-    current_value = data.get_real_time_heart_rate()
+    current_value = current_data().get_real_time_heart_rate()
     max_value = 150      # 最大値
 
     # Plotlyでドーナツ型ゲージを作成
@@ -514,10 +658,12 @@ def heartrate_gauge():
     return fig
 
 
+@cached_figure("sleep_and_active_heatmap_df")
 def sleep_or_active_heatmap():
 
-    df = data.sleep_and_active_heatmap()
-
+    grid = current_data().get_occupancy_grid()
+    if grid is None:
+        return empty_figure(HEIGHT_FAMILY, MARGIN_FAMILY)
 
     # カテゴリーに対応する色を設定
     category_colors = {
@@ -527,21 +673,11 @@ def sleep_or_active_heatmap():
     }
 
     # 2. データの前処理
-    df['最新の一ヶ月の日付'] = pd.to_datetime(df['最新の一ヶ月の日付'], format="%Y-%m-%d") 
-    df = df.sort_values(by='最新の一ヶ月の日付',ascending=False)
-
-    # 日付を文字列に変換（表示のため）
-    df['日付_str'] = df['最新の一ヶ月の日付'].dt.strftime("%-m/%-d")
-
-    # ピボットテーブルを作成（行：日付、列：時刻、値：カテゴリー）
-    pivot_table = df.pivot(index='日付_str', columns='時刻(hour)', values='カテゴリー')
-
+    # 在室状況は読み込み時に 日×時刻 のカテゴリー番号（就寝: 0, 室内: 1, 室外: 2）の配列にしてある
     # 日付を降順に並べ替え（最新の日付が上になるように）
-    pivot_table = pivot_table.iloc[::-1]
-
-    # カテゴリーを数値にマッピング
-    category_mapping = {'就寝': 0, '室内': 1, '室外': 2}
-    heatmap_data = pivot_table.replace(category_mapping)
+    heatmap_data = grid.codes[::-1]
+    if (heatmap_data == occupancy.MISSING).any():
+        heatmap_data = np.where(heatmap_data == occupancy.MISSING, np.nan, heatmap_data)
 
     # 3. ヒートマップの作成
 
@@ -552,8 +688,8 @@ def sleep_or_active_heatmap():
     fig = px.imshow(
         heatmap_data,
         labels=dict(x='時刻(hour)', y='日付', color='カテゴリー'),
-        x=heatmap_data.columns,
-        y=heatmap_data.index,
+        x=np.arange(occupancy.HOURS),
+        y=grid.labels()[::-1],
         color_continuous_scale=colorscale,
         aspect='auto'
     )
@@ -593,11 +729,10 @@ def sleep_or_active_heatmap():
     return fig
 
 
+@cached_figure("past_week_sleep_time_df")
 def sleep_active_chart():
     # サンプルデータを作成
-    df= data.past_week_sleep_time()
-
-    df["日付"] = pd.to_datetime(df["最新の一週間分の日付"],format="%Y-%m-%d").dt.strftime("%-m/%-d")
+    df= current_data().past_week_sleep_time()
 
     # 平均値を計算
     avg_blue = df["睡眠時間"].mean()
@@ -656,17 +791,18 @@ def sleep_active_chart():
         margin=dict(t=40, b=40, l=40, r=40),
         xaxis=dict(
         tickmode="array",
-        tickvals=df["最新の一週間分の日付"],
-        ticktext=df["最新の一週間分の日付"]  # 日付を「9/1, 9/2」形式で表示
+        tickvals=df["日付"],
+        ticktext=df["日付"]  # 日付を「9/1, 9/2」形式で表示
         ),
     )
 
     return fig
 
 
+@cached_figure("rader_chart_df")
 def rader_chart():
     # データの定義
-    df = data.rader_chart()
+    df = current_data().rader_chart()
     categories = df["カテゴリー"].tolist()  # カテゴリ名
     values = df["スコア"].tolist()  # 各カテゴリの値
 
@@ -709,12 +845,14 @@ def rader_chart():
     return fig
 
 
+@cached_figure("donut_chart_df")
 def donut_chart():
     
-    df = data.donut_chart()
-    # データ定義
-    labels = df["カテゴリー"].tolist()
-    values = df["外出"].tolist()
+    # データ定義（最新日の内訳）
+    breakdown = current_data().get_minute_breakdown()
+    if breakdown is None:
+        return empty_figure(HEIGHT_FAMILY, MARGIN_FAMILY)
+    labels, values = breakdown.latest()
 
     # カラースケール
     colors = ["orange", "darkblue", "limegreen", "skyblue"]
@@ -749,8 +887,9 @@ def donut_chart():
 
 def time_log():
 
-    df = data.record()
-    st.dataframe(df, use_container_width=True,hide_index=True,height=550)
+    df = current_data().record()
+    with instrument.timed("emit", "time_log"):
+        st.dataframe(df, use_container_width=True,hide_index=True,height=550)
 
 
 
@@ -1,115 +1,991 @@
-import pandas as pd
+import functools
+import hashlib
+import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import instrument
+import livefeed
+import occupancy
+from alertstore import AlertStore
+from baseline import RETAIN_DAYS, RollingBaseline
+from rollup import DailyRollup, VitalRollup
+from vitalstore import VitalStore
+
+# 共有データフレームを安全に参照で渡せるよう、copy-on-writeを有効にする
+# （ビューを変更しても元のデータフレームはコピーされて保護される）
+pd.set_option("mode.copy_on_write", True)
+
+
+class SourceStore:
+    """
+    CSVの読み込み結果をプロセス全体で共有するデータストア
+
+    Streamlitはウィジェット操作のたびにスクリプト全体を再実行するが、
+    モジュールはプロセス内で一度しか読み込まれないため、ここに置いた
+    データフレームは全セッション・全ページで共有される。
+    ファイルの更新時刻・サイズが変わった場合のみ内容のハッシュを取り直し、
+    ハッシュも変わっていれば再度パースする。
+    追記専用のデータソース（parseにappend属性があるもの）は、ファイルが伸びただけであれば
+    前回読んだ位置以降の行だけをパースしてキャッシュに追加する。
+    追記とみなすのは、前回読んだ位置までの内容全体のハッシュが変わっていない場合のみで、
+    書き込み途中の最後の行（改行で終わっていない部分）は次に読むときまでパースしない。
+    """
+
+    # 前回読んだ位置までのハッシュを取り直すときに、一度に読み込むバイト数
+    HASH_CHUNK_BYTES = 1 << 20
+    # 追記された行を後から参照できるよう保持する回数
+    APPEND_HISTORY = 16
 
-class HealthData:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        self._entries = {}
+        # 内容が同一のファイルはパース結果を共有する
+        self._by_digest = {}
+
+    def _path_lock(self, path):
+        with self._lock:
+            return self._path_locks.setdefault(path, threading.Lock())
+
+    def get(self, path, parse):
+        """
+        pathの内容をparse(パス, バイト列, ハッシュ)で読み込んだ結果を返す（変更がなければキャッシュを返す）
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["value"]
+
+        # 同じファイルを複数セッションが同時にパースしないようにする
+        with self._path_lock(path):
+            entry = self._entries.get(path)
+            if entry is not None and entry["stamp"] == stamp:
+                return entry["value"]
+            with instrument.timed("load", os.path.basename(path)):
+                return self._load(path, parse, entry, stamp)
+
+    def is_current(self, path):
+        """
+        pathの読み込み結果がキャッシュにあり、その後ファイルが変わっていないかを返す
+        """
+        path = os.path.realpath(path)
+        entry = self._entries.get(path)
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        return entry["stamp"] == (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, path, parse, entry, stamp):
+        # ファイルを読み込み、内容が変わっていればパースする（呼び出し側でパスごとのロックを取得する）
+        if entry is not None and getattr(parse, "append", None) is not None:
+            value = self._append(path, parse, entry, stamp)
+            if value is not None:
+                return value
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        # 更新時刻だけが変わった場合（touchなど）はパースし直さない
+        if entry is not None and entry["digest"] == digest:
+            entry["stamp"] = stamp
+            return entry["value"]
+
+        value = self._by_digest.get((digest, parse))
+        if value is None:
+            value = parse(path, raw, digest)
+            self._by_digest[(digest, parse)] = value
+        self._entries[path] = {
+            "stamp": stamp,
+            "digest": digest,
+            "value": value,
+            "offset": len(raw),
+            "header": raw.splitlines(keepends=True)[0] if raw else b"",
+            # 最後の行が改行で終わっていなければ、続きが書き足される可能性がある
+            "line_end": raw.endswith(b"\n"),
+            "appends": [],
+        }
+        if entry is not None:
+            self._release(entry["digest"], parse)
+        return value
+
+    def _append(self, path, parse, entry, stamp):
+        # ファイルが前回読んだ位置より伸びていて、その位置までの内容が変わっていなければ
+        # 追記された部分のうち改行で終わる行だけを読み込む（追記とみなせない場合はNoneを返し、全体を読み直させる）
+        offset = entry["offset"]
+        if stamp[1] <= offset:
+            return None
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            remaining = offset
+            while remaining:
+                chunk = f.read(min(self.HASH_CHUNK_BYTES, remaining))
+                if not chunk:
+                    return None
+                hasher.update(chunk)
+                remaining -= len(chunk)
+            if hasher.hexdigest() != entry["digest"]:
+                return None
+            added = f.read(stamp[1] - offset)
+
+        # 前回の最後の行が改行で終わっておらず、その行の続きが書き足された場合は追記とみなさない
+        if not entry["line_end"] and not added.startswith((b"\n", b"\r\n")):
+            return None
+        complete = added[:added.rfind(b"\n") + 1]
+        if not complete:
+            # 書き込み途中の行しかなければ、次に読むときまで待つ
+            entry["stamp"] = stamp
+            return entry["value"]
+        try:
+            rows = parse.append(entry["header"] + complete)
+        except ValueError:
+            return None
+
+        # 全体のハッシュは、前回までの内容のハッシュの状態に追記部分を足して求める
+        hasher.update(complete)
+        digest = hasher.hexdigest()
+        value = pd.concat([entry["value"], rows], ignore_index=True)
+
+        appends = entry["appends"] + [(entry["digest"], digest, rows)]
+        self._by_digest[(digest, parse)] = value
+        self._entries[path] = {
+            "stamp": stamp,
+            "digest": digest,
+            "value": value,
+            "offset": offset + len(complete),
+            "header": entry["header"],
+            "line_end": True,
+            "appends": appends[-self.APPEND_HISTORY:],
+        }
+        self._release(entry["digest"], parse)
+        return value
+
+    def appended(self, path, parse, since):
+        """
+        ハッシュがsinceの内容から現在の内容までに追記された行を (現在のハッシュ, 行) で返す
+        （追記以外の変更があった場合や、履歴が残っていない場合、行はNone）
+        """
+        digest, value = self.current(path, parse)
+        entry = self._entries.get(os.path.realpath(path))
+        if digest == since:
+            return digest, value.iloc[0:0]
+        rows = []
+        for before, after, added in entry["appends"]:
+            if before == since or rows:
+                rows.append(added)
+            if rows and after == digest:
+                return digest, pd.concat(rows, ignore_index=True)
+        return digest, None
+
+    def derived(self, path, parse, build, *args):
+        """
+        pathのパース結果にbuild(パース結果, *args)を適用した派生データを返す
+        （元データが変わるまでキャッシュする）
+        """
+        value = self.get(path, parse)
+        entry = self._entries.get(os.path.realpath(path))
+        if entry is None or entry["value"] is not value:
+            return build(value, *args)
+        derived = entry.setdefault("derived", {})
+        key = (build, args)
+        if key not in derived:
+            derived[key] = build(value, *args)
+        return derived[key]
+
+    def digest(self, path, parse):
+        """
+        pathの現在の内容のハッシュを返す
+        """
+        return self.current(path, parse)[0]
+
+    def current(self, path, parse):
+        """
+        pathの現在の内容の (ハッシュ, パース結果) を返す
+        """
+        value = self.get(path, parse)
+        entry = self._entries.get(os.path.realpath(path))
+        if entry is None or entry["value"] is not value:
+            return self.current(path, parse)
+        return entry["digest"], value
+
+    def _release(self, digest, parse):
+        # どのファイルからも参照されなくなった古いパース結果を破棄する
+        if all(e["digest"] != digest for e in list(self._entries.values())):
+            self._by_digest.pop((digest, parse), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_digest.clear()
+
+
+# プロセス全体で共有するストア
+store = SourceStore()
+
+
+# データソース（実ファイル）の定義
+# 同じデータソースは何度参照されても一度だけパースされる
+SOURCES = {
+    "realtime": "realtime.csv",
+    "todayheart": "todayheart.csv",
+    "todayheartmax": "todayheartmax.csv",
+    "active": "active.csv",
+    "week_sleep": "week_sleep.csv",
+    "move": "move.csv",
+    "todaymove": "todaymove.csv",
+    "room": "room.csv",
+    "fall": "fall.csv",
+    "log": "log.csv",
+    "today_move_log": "today_move_log.csv",
+    "vitalpattern": "vitalpattern.csv",
+    "family_sleep_active_time": "family_sleep_active_time.csv",
+    "record": "record.csv",
+    "sleep_active_heatmap": "sleep-active-heatmap.csv",
+    "past_week_sleep_time": "past-week-sleep-time.csv",
+    "rader_chart": "rader-chart.csv",
+    "donut_chart": "donut-chart.csv",
+    "today_wakeup_active_time": "today-wakeup-active-time.csv",
+    "staff_vital": "staff-vital.csv",
+    "month_sleep_roomout_heatmap": "month-sleep-roomout-heatmap.csv",
+    # 入居者一覧（入居者ID・氏名・フロア）。任意のデータソースで、ない場合は入居者IDのみで表示する
+    "residents": "residents.csv",
+}
+
+# 論理的なデータセットとデータソースの対応
+# 同じデータソースを参照するデータセットは、パース結果の同一のデータフレームを共有する
+# （共有されるため、取得したデータフレームを直接書き換えてはいけない）
+DATASETS = {
+    "real_time_df": "realtime",
+    "today_heartrate_respiratory_df": "todayheart",
+    "week_heartrate_respiratory_df": "todayheartmax",
+    "today_sleep_active_time_df": "active",
+    "month_sleep_active_time_df": "week_sleep",
+    "today_room_move_df": "move",
+    "bet_in_out_distance_df": "todaymove",
+    "week_room_in_out_df": "room",
+    "fall_down_df": "fall",
+    "alert_log_df": "log",
+    "today_move_log_df": "today_move_log",
+    "vital_pattern_df": "vitalpattern",
+    "health_score_df": "vitalpattern",
+    "live_log_df": "vitalpattern",
+    "family_sleep_active_time_df": "family_sleep_active_time",
+    "record_df": "record",
+    "sleep_and_active_heatmap_df": "sleep_active_heatmap",
+    "past_week_sleep_time_df": "past_week_sleep_time",
+    "rader_chart_df": "rader_chart",
+    "donut_chart_df": "donut_chart",
+    "today_wakeup_active_time_df": "today_wakeup_active_time",
+    "staff_vital_df": "staff_vital",
+    "month_sleep_roomout_heatmap_df": "month_sleep_roomout_heatmap",
+    "residents_df": "residents",
+}
+
+# 追記専用のデータソース（1日を通して行が追加されていくもの）
+# ファイルが伸びた場合は、追記された行だけをパースして読み込み済みのデータに追加する
+APPEND_ONLY = {"room", "todaymove"}
+
+# 日時として読み込む列とその書式（データソースごと）
+DATE_FORMATS = {
+    "week_sleep": {"日付": "%Y-%m-%d"},
+    "room": {"日付": "%Y-%m-%d"},
+    "fall": {"日付": "%Y-%m-%d"},
+    "log": {"時刻": "%Y/%m/%d %H:%M:%S"},
+    "sleep_active_heatmap": {"最新の一ヶ月の日付": "%Y-%m-%d"},
+    "past_week_sleep_time": {
+        "最新の一週間分の日付": "%Y-%m-%d",
+        "寝た時刻": "%Y-%m-%d %H:%M:%S",
+        "起きた時刻": "%Y-%m-%d %H:%M:%S",
+    },
+    "donut_chart": {"日付": "%Y-%m-%d"},
+    "staff_vital": {"日時": "%Y-%m-%d"},
+    "month_sleep_roomout_heatmap": {"日付": "%Y-%m-%d"},
+}
+
+# カテゴリー型として読み込む列（データソースごと）
+# 値の種類が少ない文字列の列は、読み込み時にカテゴリー型にしてメモリと文字列の比較・集計を減らす
+CATEGORY_COLUMNS = {
+    "week_sleep": ["曜日", "週目"],
+    "fall": ["曜日", "週目"],
+    "month_sleep_roomout_heatmap": ["曜日", "週目"],
+    "log": ["アラート内容", "危険度"],
+    "sleep_active_heatmap": ["カテゴリー"],
+    "rader_chart": ["カテゴリー"],
+    "donut_chart": ["カテゴリー"],
+}
+
+# 入居者IDの列名
+# この列を持つデータソースは複数の入居者のデータを含み、入居者ごとに分割して参照する
+# （この列がないデータソースは、どの入居者からも同じデータとして参照される）
+RESIDENT_COLUMN = "入居者ID"
+
+
+class Partitions:
+    """
+    データフレームを入居者ID・日付ごとに分割した索引
+
+    入居者1人分のデータは辞書の参照で、1日分のデータは行番号の参照で取り出せる。
+    日付にはDATE_FORMATSで最初に宣言された列を使う。
+    """
+
+    def __init__(self, df, date_column=None):
+        self.frame = df
+        self.partitioned = RESIDENT_COLUMN in df.columns
+        self._empty = df.iloc[0:0]
+        self._residents = {}
+        self._days = {}
+
+        residents = df[RESIDENT_COLUMN].astype(str) if self.partitioned else None
+        if self.partitioned:
+            self._residents = {
+                resident_id: part.reset_index(drop=True)
+                for resident_id, part in df.groupby(residents, sort=False)
+            }
+        if date_column is not None:
+            days = df[date_column].dt.normalize()
+            keys = [residents, days] if self.partitioned else [days]
+            self._days = df.groupby(keys, sort=False).indices
+
+    def resident_ids(self):
+        return list(self._residents)
+
+    def resident(self, resident_id):
+        """
+        入居者のデータを返す（入居者IDの列がないデータソースやresident_idがNoneの場合は全体を返す）
+        """
+        if not self.partitioned or resident_id is None:
+            return self.frame
+        return self._residents.get(str(resident_id), self._empty)
+
+    def day(self, resident_id, date):
+        """
+        入居者の指定日のデータを返す
+        """
+        date = pd.Timestamp(date).normalize()
+        key = (str(resident_id), date) if self.partitioned else date
+        positions = self._days.get(key)
+        if positions is None:
+            return self._empty
+        return self.frame.take(positions).reset_index(drop=True)
+
+
+def partition(df, source, projection=None):
+    """
+    データソース（projectionを指定した場合はその派生データ）を入居者・日付で分割する
+    """
+    if projection is not None:
+        # 派生データは日付の列を表示用に変換していることがあるため、日付の索引は作らない
+        return Partitions(projection(df))
+    date_column = next(iter(DATE_FORMATS.get(source, {})), None)
+    return Partitions(df, date_column)
+
+
+# スナップショット（型付きのParquetファイル）を置くディレクトリ名
+SNAPSHOT_DIR = "snapshot"
+# スナップショットの元になったCSVのハッシュを記録するメタデータのキー
+SNAPSHOT_DIGEST_KEY = b"source_sha256"
+# スナップショットの形式の版を記録するメタデータのキー
+SNAPSHOT_FORMAT_KEY = b"format_version"
+# スナップショットの形式の版（parse_csvが返す列の型を変えたら上げる）
+# 版が異なるスナップショットは使わず、CSVから作り直す
+SNAPSHOT_FORMAT = b"2"
+
+
+def parse_csv(source, raw):
+    """
+    CSVのバイト列をパースし、スキーマに従って日時列・カテゴリー列を変換する
+    """
+    # 入居者IDは数字だけのIDでも文字列として読み込む（URLで指定された入居者IDと照合するため）
+    df = pd.read_csv(io.BytesIO(raw), encoding='utf-8-sig', dtype={RESIDENT_COLUMN: str})
+    for column, date_format in DATE_FORMATS.get(source, {}).items():
+        df[column] = pd.to_datetime(df[column], format=date_format)
+    for column in CATEGORY_COLUMNS.get(source, []):
+        df[column] = df[column].astype("category")
+    return df
+
+
+def snapshot_path(path):
+    """
+    CSVファイルに対応するスナップショットのパスを返す
+    """
+    data_dir, file_name = os.path.split(path)
+    return os.path.join(data_dir, SNAPSHOT_DIR, os.path.splitext(file_name)[0] + ".parquet")
+
+
+def _snapshot_metadata(path):
+    # スナップショットのメタデータを返す（スナップショットがなければNone）
+    snapshot = snapshot_path(path)
+    if not os.path.exists(snapshot):
+        return None
+    return pq.read_schema(snapshot).metadata or {}
+
+
+def read_snapshot(path, digest):
+    """
+    スナップショットをメモリマップで読み込む（元のCSVと内容が一致しない場合や、形式の版が異なる場合はNone）
+    """
+    metadata = _snapshot_metadata(path)
+    if metadata is None or metadata.get(SNAPSHOT_DIGEST_KEY) != digest.encode():
+        return None
+    if metadata.get(SNAPSHOT_FORMAT_KEY) != SNAPSHOT_FORMAT:
+        return None
+    return pq.read_table(snapshot_path(path), memory_map=True).to_pandas()
+
+
+def is_outdated_snapshot(path, digest):
+    """
+    元のCSVと内容は一致するが、形式の版が古いスナップショットがあるかを返す
+    """
+    metadata = _snapshot_metadata(path)
+    return (
+        metadata is not None
+        and metadata.get(SNAPSHOT_DIGEST_KEY) == digest.encode()
+        and metadata.get(SNAPSHOT_FORMAT_KEY) != SNAPSHOT_FORMAT
+    )
+
+
+def write_snapshot(df, path, digest):
+    """
+    パース済みのデータフレームをCSVファイルのスナップショットとして書き出し、そのパスを返す
+
+    読み込み中のスナップショットを壊さないよう、一時ファイルに書いてから置き換える。
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SNAPSHOT_DIGEST_KEY] = digest.encode()
+    metadata[SNAPSHOT_FORMAT_KEY] = SNAPSHOT_FORMAT
+
+    snapshot = snapshot_path(path)
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    temporary = f"{snapshot}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), temporary)
+    os.replace(temporary, snapshot)
+    return snapshot
+
+
+def compile_snapshot(source, path):
+    """
+    CSVファイルを型付きのスナップショットに変換し、書き出したパスを返す
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    return write_snapshot(parse_csv(source, raw), path, hashlib.sha256(raw).hexdigest())
+
+
+@functools.lru_cache(maxsize=None)
+def _loader(source):
+    # 新しいスナップショットがあればそれを、なければCSVを読み込む
+    # 形式の版が古いだけのスナップショットは、パースした結果で作り直す
+    def load(path, raw, digest):
+        df = read_snapshot(path, digest)
+        if df is None:
+            df = parse_csv(source, raw)
+            if is_outdated_snapshot(path, digest):
+                write_snapshot(df, path, digest)
+        return df
+    # 追記専用のデータソースは、追記された部分（ヘッダー行付き）だけをパースできるようにする
+    if source in APPEND_ONLY:
+        load.append = functools.partial(parse_csv, source)
+    return load
+
+
+def read_source(source, data_dir):
+    """
+    データソースを共有ストア経由で読み込む
+    """
+    return store.get(os.path.join(data_dir, SOURCES[source]), _loader(source))
+
+
+def read_derived(source, data_dir, build, *args):
+    """
+    データソースから作った派生データ（表示用の列など）を共有ストア経由で取得する
+    """
+    return store.derived(os.path.join(data_dir, SOURCES[source]), _loader(source), build, *args)
+
+
+def appended_rows(source, data_dir, since):
+    """
+    データソースのハッシュがsinceだった時点以降に追記された行を (現在のハッシュ, 行) で返す
+    （追記以外の変更があれば行はNone）
+    """
+    return store.appended(os.path.join(data_dir, SOURCES[source]), _loader(source), since)
+
+
+def source_digest(source, data_dir):
+    """
+    データソースの現在の内容のハッシュを返す
+    """
+    return store.digest(os.path.join(data_dir, SOURCES[source]), _loader(source))
+
+
+# データソースを並行して読み込むスレッド数（読み込みの待ち時間が重ならないよう、データソースの数だけ用意する）
+PRELOAD_WORKERS = len(SOURCES)
+
+_preload_pool = None
+_preload_lock = threading.Lock()
+
+
+def preload(data_dir, sources=None):
+    """
+    データソースを並行して読み込み、共有ストアに載せる（読み込み済みで変更のないものは読み込まない）
+
+    ファイルの読み込みとパースはデータソースごとにスレッドプールで行うため、
+    全体の時間は合計ではなく最も遅いデータソースの時間で決まる。
+    データソースごとの読み込み時間は、呼び出したスレッドで実行中のスクリプトの計測結果に記録する。
+    読み込みに失敗したデータソースは、参照したときに改めて読み込んでエラーにする。
+    """
+    sources = list(sources or SOURCES)
+    # 異常検知のログはデータフレームとしては読み込まず、ログのストアへの取り込みを始めておく（終わるのは待たない）
+    if "log" in sources and has_source("log", data_dir):
+        sync_alerts(data_dir)
+    stale = [
+        source for source in sources
+        if source != "log" and has_source(source, data_dir)
+        and not store.is_current(os.path.join(data_dir, SOURCES[source]))
+    ]
+    if not stale:
+        return
+    pool = _preload_executor()
+    with instrument.timed("load", "preload"):
+        load = instrument.bind(read_source)
+        wait([pool.submit(load, source, data_dir) for source in stale])
+
+
+def _preload_executor():
+    # データソースの読み込みに使うスレッドプールを返す（初めて使うときに作る）
+    global _preload_pool
+    with _preload_lock:
+        if _preload_pool is None:
+            _preload_pool = ThreadPoolExecutor(PRELOAD_WORKERS, thread_name_prefix="preload")
+    return _preload_pool
+
+
+def compile_snapshots(data_dir):
+    """
+    データディレクトリ内のすべてのデータソースをスナップショットに変換する
+    """
+    return [
+        compile_snapshot(source, os.path.join(data_dir, file_name))
+        for source, file_name in SOURCES.items()
+        if has_source(source, data_dir)
+    ]
+
+
+def has_source(source, data_dir):
+    """
+    データソースのファイルが存在するかを返す（入居者一覧など任意のデータソースの確認用）
+    """
+    return os.path.exists(os.path.join(data_dir, SOURCES[source]))
+
+
+# 派生データ（表示用のラベル列など）
+# 元データは共有されるため書き換えず、列を追加した新しいデータフレームとして一度だけ作る
+def _month_sleep_labels(df):
+    return df.assign(**{"日付_再計算": df["日付"].dt.strftime("%-m/%-d")})
+
+
+def _room_labels(df):
+    labels = df["日付"].dt.strftime("%-m/%d")
+    return df.assign(**{"日付": labels, "日付_再調整": labels})
+
+
+def _sleep_active_heatmap_labels(df):
+    df = df.sort_values(by="最新の一ヶ月の日付", ascending=False)
+    return df.assign(**{"日付_str": df["最新の一ヶ月の日付"].dt.strftime("%-m/%-d")})
+
+
+def _past_week_labels(df):
+    return df.assign(**{"日付": df["最新の一週間分の日付"].dt.strftime("%-m/%-d")})
+
+
+# 集計テーブルの定義（名前: (データソース, 日付の列, {列名: 集計方法}, 追加のキー)）
+# グラフは描画のたびに元データを集計せず、ここで保持する日・週・月ごとの集計値を参照する
+ROLLUPS = {
+    "sleep": ("month_sleep_roomout_heatmap", "日付", {"睡眠時間": "sum", "室外時間": "sum", "週目": "first", "曜日": "first"}, ()),
+    "fall": ("fall", "日付", {"転倒検知": "sum", "週目": "first", "曜日": "first"}, ()),
+    "room": ("room", "日付", {"入退室数": "sum"}, ("時刻",)),
+}
+
+# {(データディレクトリ, 集計名): [集計に反映済みのハッシュ, DailyRollup, 更新用のロック]}
+_rollups = {}
+# {データディレクトリ: VitalRollup}
+_vital_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def read_rollup(name, data_dir):
+    """
+    集計テーブルを返す（データソースの内容が変わっていれば、変わった日だけを集計し直す）
+    """
+    source, date_column, aggregates, keys = ROLLUPS[name]
+    digest = source_digest(source, data_dir)
+    with _rollups_lock:
+        entry = _rollups.setdefault((data_dir, name), [None, DailyRollup(date_column, aggregates, keys), threading.Lock()])
+    if entry[0] != digest:
+        # 同じ追記分を複数のセッションが二重に足し込まないようにする
+        with entry[2]:
+            if entry[0] != digest:
+                # 追記されただけであれば、追記された行を集計値に足し込む
+                digest, rows = appended_rows(source, data_dir, entry[0])
+                if rows is not None:
+                    entry[1].append(_by_resident(rows))
+                else:
+                    digest, df = store.current(os.path.join(data_dir, SOURCES[source]), _loader(source))
+                    entry[1].refresh(_by_resident(df), partitioned=RESIDENT_COLUMN in df.columns)
+                entry[0] = digest
+    return entry[1]
+
+
+def read_vital_rollup(data_dir, store, resident_id):
+    """
+    高頻度のバイタルの集計を返す（入居者のセグメントに追加されたサンプルを反映してから返す）
+    """
+    with _rollups_lock:
+        rollup = _vital_rollups.setdefault(data_dir, VitalRollup())
+    rollup.refresh(store, resident_id)
+    return rollup
+
+
+# {データディレクトリ: [反映済みの入退室数の集計テーブル, RollingBaseline, {(入居者ID, 日付): 反映済みのサンプル数}, 更新用のロック]}
+_baselines = {}
+
+
+def read_baseline(data_dir, store, resident_id):
+    """
+    比較の基準値（入居者・指標・日ごとの平均・分散）を返す
+
+    指標は "heart"・"resp"（高頻度のバイタルの各サンプル）と "room"（日ごとの入退室数の合計）。
+    入居者のセグメントに追加されたサンプルと、入退室数の集計が変わった日を反映してから返す。
+    """
+    with _rollups_lock:
+        entry = _baselines.setdefault(data_dir, [None, RollingBaseline(), {}, threading.Lock()])
+    _, baseline, counts, lock = entry
+    with lock:
+        # 過去の日のセグメントは追記されないため、反映済みであれば読み直さない
+        if resident_id is not None:
+            days = store.days(resident_id)[-RETAIN_DAYS:]
+            for day in days:
+                key = (str(resident_id), day)
+                if key in counts and day != days[-1]:
+                    continue
+                segment = store.segment(resident_id, day)
+                done = counts.get(key, 0)
+                if len(segment) > done:
+                    baseline.add(resident_id, "heart", day, segment.heart[done:])
+                    baseline.add(resident_id, "resp", day, segment.resp[done:])
+                    counts[key] = len(segment)
+
+        # 入退室数は集計テーブルが更新されたときに、日ごとの合計を入れ替える
+        if has_source("room", data_dir):
+            table = read_rollup("room", data_dir).table
+            if table is not entry[0]:
+                totals = table["入退室数"].groupby(level=[0, 1]).sum()
+                recent = totals.groupby(level=0, group_keys=False).tail(RETAIN_DAYS)
+                for (resident, day), total in recent.items():
+                    baseline.replace(resident, "room", day, total)
+                entry[0] = table
+    return baseline
+
+
+# 異常検知のログを保存するSQLiteのファイル名（データディレクトリ内）
+ALERTS_DB = "alerts.sqlite"
+
+# {データディレクトリ: AlertStore}
+_alert_stores = {}
+_alert_stores_lock = threading.Lock()
+
+
+# {データディレクトリ: log.csvを取り込むFuture}
+_alert_syncs = {}
+
+
+def sync_alerts(data_dir):
+    """
+    log.csvが前回の取り込みから変わっていれば、スレッドプールで取り込みを始め、そのFutureを返す
+    （取り込みの必要がなければNone。取り込み中であれば、始めた取り込みのFutureを返す）
+    """
+    alerts = _alert_store(data_dir)
+    csv_path = os.path.join(data_dir, SOURCES["log"])
+    if alerts.is_synced(csv_path):
+        return None
+    with _alert_stores_lock:
+        future = _alert_syncs.get(data_dir)
+        if future is None or future.done():
+            future = _alert_syncs[data_dir] = _preload_executor().submit(
+                alerts.sync, csv_path, functools.partial(parse_csv, "log")
+            )
+    return future
+
+
+def _alert_store(data_dir):
+    # データディレクトリのストアを返す（プロセスで1つだけ開く）
+    with _alert_stores_lock:
+        alerts = _alert_stores.get(data_dir)
+        if alerts is None:
+            alerts = _alert_stores[data_dir] = AlertStore(os.path.join(data_dir, ALERTS_DB))
+    return alerts
+
+
+def read_alerts(data_dir):
+    """
+    異常検知のログのストアを返す
+
+    log.csvが前回の取り込みから変わっていれば、バックグラウンドで取り込み直す（取り込みが終わるまでは前回の内容を返す）。
+    一度も取り込んだことがない場合だけは、取り込みが終わるまで待つ。
+    """
+    alerts = _alert_store(data_dir)
+    future = sync_alerts(data_dir)
+    if future is not None and not alerts.has_synced():
+        with instrument.timed("load", ALERTS_DB):
+            future.result()
+    return alerts
+
+
+def clear_caches():
+    """
+    共有ストアと、集計テーブル・基準値・ログのストアのキャッシュをすべて空にする（読み込み前の状態からの計測用）
+
+    ログのストアの取り込み済みの内容（SQLiteのファイル）はそのまま残す。
+    """
+    store.clear()
+    with _rollups_lock:
+        _rollups.clear()
+        _vital_rollups.clear()
+        _baselines.clear()
+    with _alert_stores_lock:
+        _alert_stores.clear()
+        _alert_syncs.clear()
+
+
+# データディレクトリ（環境変数 HEALTHDATA_DIR で変更できる）
+DATA_DIR = os.environ.get("HEALTHDATA_DIR", os.path.join('.', 'data'))
+# 高頻度のバイタル（心拍数・呼吸数）を保存するディレクトリ名
+VITALS_DIR = "vitals"
+# 高頻度のバイタルを1日の推移として表示するときにまとめる単位（numpyの日時の単位、"m"は1分）
+VITAL_DISPLAY_UNIT = "m"
+# 入居者を指定しない場合の入居者ID
+DEFAULT_RESIDENT = "default"
+
+
+@instrument.timed_methods("accessor", exclude=("resident_ids", "partitions", "dataset", "view", "day", "version", "baseline", "preload"))
+class HealthData:
+    # resident_idにNoneを指定すると、施設全体（全入居者）のデータを参照する
+    def __init__(self, data_dir=None, resident_id=DEFAULT_RESIDENT):
         # データディレクトリのパスを設定
-        data_dir = os.path.join('.', 'data')
-        
-        # ダミーデータのインポート（エンコーディングを指定）
-        self.real_time_df = pd.read_csv(
-            os.path.join(data_dir, "realtime.csv"), encoding='utf-8-sig'
-        )
-        self.today_heartrate_respiratory_df = pd.read_csv(
-            os.path.join(data_dir, "todayheart.csv"), encoding='utf-8-sig'
-        )
-        self.week_heartrate_respiratory_df = pd.read_csv(
-            os.path.join(data_dir, "todayheartmax.csv"), encoding='utf-8-sig'
-        )
-        self.today_sleep_active_time_df = pd.read_csv(
-            os.path.join(data_dir, "active.csv"), encoding='utf-8-sig'
-        )
-        self.month_sleep_active_time_df = pd.read_csv(
-            os.path.join(data_dir, "week_sleep.csv"), encoding='utf-8-sig'
-        )
-        self.today_room_move_df = pd.read_csv(
-            os.path.join(data_dir, "move.csv"), encoding='utf-8-sig'
-        )
-        self.bet_in_out_distance_df = pd.read_csv(
-            os.path.join(data_dir, "todaymove.csv"), encoding='utf-8-sig'
-        )
-        self.week_room_in_out_df = pd.read_csv(
-            os.path.join(data_dir, "room.csv"), encoding='utf-8-sig'
-        )
-        self.fall_down_df = pd.read_csv(
-            os.path.join(data_dir, "fall.csv"), encoding='utf-8-sig'
-        )
-        self.alert_log_df = pd.read_csv(
-            os.path.join(data_dir, "log.csv"), encoding='utf-8-sig'
-        )
-        self.today_move_log_df = pd.read_csv(
-            os.path.join(data_dir, "today_move_log.csv"), encoding='utf-8-sig'
-        )
-        self.vital_pattern_df = pd.read_csv(
-            os.path.join(data_dir, "vitalpattern.csv"), encoding='utf-8-sig'
-        )
-        self.health_score_df = pd.read_csv(
-            os.path.join(data_dir, "vitalpattern.csv"), encoding='utf-8-sig'
-        )
-        self.live_log_df = pd.read_csv(
-            os.path.join(data_dir, "vitalpattern.csv"), encoding='utf-8-sig'
-        )
-        self.family_sleep_active_time_df = pd.read_csv(
-            os.path.join(data_dir, "family_sleep_active_time.csv"), encoding='utf-8-sig'
-        )
-        self.record_df = pd.read_csv(
-            os.path.join(data_dir, "record.csv"), encoding='utf-8-sig'
-        )
-        self.sleep_and_active_heatmap_df = pd.read_csv(
-            os.path.join(data_dir, "sleep-active-heatmap.csv"), encoding='utf-8-sig'
-        )
-        self.past_week_sleep_time_df = pd.read_csv(
-            os.path.join(data_dir, "past-week-sleep-time.csv"), encoding='utf-8-sig'
-        )
-        self.rader_chart_df = pd.read_csv(
-            os.path.join(data_dir, "rader-chart.csv"), encoding='utf-8-sig'
-        )
-        self.donut_chart_df = pd.read_csv(
-            os.path.join(data_dir, "donut-chart.csv"), encoding='utf-8-sig'
-        )
-        self.today_wakeup_active_time_df = pd.read_csv(
-            os.path.join(data_dir, "today-wakeup-active-time.csv"), encoding='utf-8-sig'
-        )
-        self.staff_vital_df = pd.read_csv(
-            os.path.join(data_dir, "staff-vital.csv"), encoding='utf-8-sig'
-        )
-        self.month_sleep_roomout_heatmap_df = pd.read_csv(
-            os.path.join(data_dir, "month-sleep-roomout-heatmap.csv"), encoding='utf-8-sig'
-        )
+        self.data_dir = data_dir or DATA_DIR
+        self.resident_id = resident_id
+        self.vitals = VitalStore(os.path.join(self.data_dir, VITALS_DIR))
+        self.live = livefeed.feed
 
-    
+    def __getattr__(self, name):
+        # データセットは初めてアクセスされた時点で共有ストアから取得する
+        if name not in DATASETS:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        return self.dataset(name)
+
+    # ページで使うデータセットのデータソースをまとめて並行して読み込む（最初の表示やデータの更新後の読み込みを短くする）
+    # namesを省略した場合はすべてのデータソースを読み込む
+    def preload(self, names=None):
+        preload(self.data_dir, None if names is None else list(dict.fromkeys(DATASETS[name] for name in names)))
+
+    # データに含まれる入居者IDの一覧を取得（入居者IDの列を持たないデータの場合は空）
+    def resident_ids(self):
+        return self.partitions("real_time_df").resident_ids()
+
+    def partitions(self, name, projection=None):
+        """
+        データセットの入居者・日付ごとの索引を返す
+        """
+        source = DATASETS[name]
+        return read_derived(source, self.data_dir, partition, source, projection)
+
+    def dataset(self, name):
+        """
+        データセット名に対応するデータソースを読み込み、この入居者の分を返す
+        """
+        return self.partitions(name).resident(self.resident_id)
+
+    def view(self, name, projection=None):
+        """
+        データセット（projectionを指定した場合はその派生データ）のこの入居者の分のビューを返す
+
+        データはコピーせずに共有し、呼び出し側が変更した場合のみcopy-on-writeでコピーされる。
+        """
+        return self.partitions(name, projection).resident(self.resident_id).copy(deep=False)
+
+    def day(self, name, date):
+        """
+        データセットのうち、この入居者の指定日の分を返す
+        """
+        return self.partitions(name).day(self.resident_id, date)
+
+    def version(self, *names):
+        """
+        データセットの版を表すタプルを返す（内容が変わると値が変わる）
+
+        namesにはDATASETSのデータセット名か、高頻度のバイタル（受信中のデータを含む）を表す"vitals"、
+        保存済みの高頻度のバイタルだけを表す"stored_vitals"を指定する。
+        受信中のデータを読まない図には"stored_vitals"を使い、サンプルを受信するたびに作り直さないようにする。
+        """
+        parts = [self.data_dir, self.resident_id]
+        for name in names:
+            if name in ("vitals", "stored_vitals"):
+                segment = self.vital_segment()
+                parts.append(None if segment is None else (segment.path, len(segment)))
+            if name == "vitals":
+                parts.append(self.live.version(self.resident_id))
+            elif name != "stored_vitals":
+                parts.append(source_digest(DATASETS[name], self.data_dir))
+        return tuple(parts)
+
+    # 最新日のバイタルのセグメントを取得（高頻度のデータがなければNone）
+    def vital_segment(self):
+        if self.resident_id is None:
+            return None
+        return self.vitals.segment(self.resident_id)
+
+    # 最新のバイタル (時刻, 心拍数, 呼吸数) を取得
+    # 受信中のデータ、保存済みの高頻度のデータの順に探し、どちらもなければNone
+    def latest_vitals(self):
+        latest = self.live.latest(self.resident_id)
+        if latest is None:
+            segment = self.vital_segment()
+            latest = segment.latest() if segment is not None else None
+        return latest
+
+    # 直近seconds秒間の受信中のバイタルを取得（受信していなければNone）
+    def get_live_window(self, seconds):
+        window = self.live.window(self.resident_id, seconds)
+        if window is None:
+            return None
+        time, heart, resp = window
+        return pd.DataFrame({"時間": time, "心拍数": heart, "呼吸数": resp})
 
     # リアルタイムの心拍数を取得
     def get_real_time_heart_rate(self):
+        latest = self.latest_vitals()
+        if latest is not None:
+            return int(round(float(latest[1])))
         return self.real_time_df.at[0, "リアルタイムの心拍数"]
 
     # 昨日の心拍数との比較（増減率）
+    # 高頻度のバイタルがある場合は、前日のサンプルの平均と比較する
     def get_heart_rate_change_ratio(self):
-        return round(
-            self.real_time_df.at[0, "リアルタイムの心拍数"] /
-            self.real_time_df.at[0, "昨日の心拍数の平均"],
-            2,
-        )
+        heart_rate = self.get_real_time_heart_rate()
+        change = self.get_baseline_change("heart", heart_rate)
+        if change is not None:
+            return round(1 + change, 2)
+        return round(heart_rate / self.real_time_df.at[0, "昨日の心拍数の平均"], 2)
 
     # リアルタイムの呼吸数を取得
     def get_real_time_respiratory_rate(self):
+        latest = self.latest_vitals()
+        if latest is not None:
+            return int(round(float(latest[2])))
         return self.real_time_df.at[0, "リアルタイムの呼吸数"]
 
     # 昨日の呼吸数との比較（増減率）
+    # 高頻度のバイタルがある場合は、前日のサンプルの平均と比較する
     def get_respiratory_rate_change_ratio(self):
-        return round(
-            self.real_time_df.at[0, "リアルタイムの呼吸数"] /
-            self.real_time_df.at[0, "昨日の呼吸数の平均"],
-            2,
-        )
+        respiratory_rate = self.get_real_time_respiratory_rate()
+        change = self.get_baseline_change("resp", respiratory_rate)
+        if change is not None:
+            return round(1 + change, 2)
+        return round(respiratory_rate / self.real_time_df.at[0, "昨日の呼吸数の平均"], 2)
+
+    # 本日の心拍数の平均と昨日の心拍数の平均との増減率（(本日 - 昨日) / 昨日）
+    def get_heart_rate_increase_decrease(self):
+        change = self.get_daily_change("heart")
+        if change is not None:
+            return change
+        df = self.staff_vital_df
+        return (df.at[0, "今日の心拍数"] - df.at[0, "昨日の心拍数"]) / df.at[0, "昨日の心拍数"]
+
+    # 本日の呼吸数の平均と昨日の呼吸数の平均との増減率（(本日 - 昨日) / 昨日）
+    def get_respiratory_increase_decrease(self):
+        change = self.get_daily_change("resp")
+        if change is not None:
+            return change
+        df = self.staff_vital_df
+        return (df.at[0, "今日の呼吸数"] - df.at[0, "昨日の呼吸数"]) / df.at[0, "昨日の呼吸数"]
+
+    # 比較の基準値を取得
+    def baseline(self):
+        return read_baseline(self.data_dir, self.vitals, self.resident_id)
+
+    def _baseline_key(self, metric):
+        # 入居者IDの列がない入退室数は、既定の入居者の基準値を参照する
+        if metric == "room" and not self.rollup("room").partitioned:
+            return DEFAULT_RESIDENT
+        return self.resident_id
 
-    # 一日の心拍数と呼吸数の推移データを取得
-    def get_today_heartrate_respiratory(self):
-        return self.today_heartrate_respiratory_df.copy()
+    # 指標（"heart", "resp", "room"）の最新日の前日までのdays日間の平均・標準偏差・件数を取得（履歴がなければNone）
+    def get_baseline(self, metric, days=1):
+        stats = self.baseline().window(self._baseline_key(metric), metric, days)
+        if stats is None:
+            return None
+        return {"平均": stats.mean, "標準偏差": stats.std, "件数": stats.count}
+
+    # 値と、指標の直近days日間の平均との増減率（(値 - 平均) / 平均）を取得（履歴がなければNone）
+    def get_baseline_change(self, metric, value, days=1):
+        stats = self.baseline().window(self._baseline_key(metric), metric, days)
+        if stats is None or not stats.mean:
+            return None
+        return (value - stats.mean) / stats.mean
+
+    # 指標の最新日の平均と、直近days日間の平均との増減率を取得（履歴がなければNone）
+    def get_daily_change(self, metric, days=1):
+        today = self.baseline().today(self._baseline_key(metric), metric)
+        if today is None:
+            return None
+        return self.get_baseline_change(metric, today.mean, days)
+
+    # 一日の心拍数と呼吸数の推移データを (時間, 心拍数, 呼吸数) の配列で取得
+    # 高頻度のデータがある場合は [start, end) の範囲を表示用にunitごとの平均にまとめる（unit=Noneの場合はメモリマップのビュー）
+    def get_today_heartrate_respiratory(self, start=None, end=None, unit=VITAL_DISPLAY_UNIT):
+        segment = self.vital_segment()
+        if segment is None or len(segment) == 0:
+            df = self.view("today_heartrate_respiratory_df")
+            return df["時間"].to_numpy(), df["心拍数"].to_numpy(), df["呼吸数"].to_numpy()
+        if unit is None:
+            return segment.slice(start, end)
+        return segment.resample(start, end, unit)
 
     # 1週間の心拍数・呼吸数の最大値・最小値データを取得
+    # 高頻度のデータがある場合は、日ごとの集計から直近7日分の統計量を返す
     def get_weekly_heartrate_respiratory(self):
-        return self.week_heartrate_respiratory_df.copy()
+        stats = self.vital_stats()
+        if stats is None:
+            return self.view("week_heartrate_respiratory_df")
+        stats = stats.tail(7)
+        return stats.assign(**{"日付": stats["日付"].dt.strftime("%-m/%-d")})
+
+    # 高頻度のバイタルの日（freq=None）・週（"W-SAT"）・月（"M"）ごとの統計量を取得（データがなければNone）
+    def vital_stats(self, freq=None):
+        if self.resident_id is None:
+            return None
+        return read_vital_rollup(self.data_dir, self.vitals, self.resident_id).stats(self.resident_id, freq)
+
+    # 集計テーブルを取得（名前はROLLUPSを参照）
+    def rollup(self, name):
+        return read_rollup(name, self.data_dir)
+
+    # 週目×曜日のカレンダー形式の集計値を取得
+    def get_calendar_grid(self, name, value):
+        return self.rollup(name).grid(self.resident_id, "週目", "曜日", value)
+
+    # 日付×時刻の入退室数を取得（日付は表示用のラベル）
+    def get_room_entry_exit_grid(self):
+        return self.rollup("room").grid(self.resident_id, "日付", "時刻", "入退室数", label_format="%-m/%d")
 
     # 本日の起床時間を取得
     def get_today_wakeup_time(self):
@@ -121,11 +997,11 @@ class HealthData:
 
     # 本日と昨日の睡眠時間・活動時間データを取得
     def get_today_yesterday_sleep_active(self):
-        return self.today_sleep_active_time_df.copy()
+        return self.view("today_sleep_active_time_df")
 
     # 一ヶ月の睡眠時間と活動時間の内訳データを取得
     def get_monthly_sleep_active(self):
-        return self.month_sleep_active_time_df.copy()
+        return self.view("month_sleep_active_time_df", _month_sleep_labels)
 
     # 本日の入退室数を取得
     def get_today_room_entry_exit_count(self):
@@ -133,11 +1009,17 @@ class HealthData:
 
     # 昨日の入退室数との比較（増減率）
     def get_room_entry_exit_change_ratio(self):
-        return round(
-            self.today_room_move_df.at[0, "本日の入退室数"] /
-            self.today_room_move_df.at[0, "昨日の入退室数"],
-            2,
-        )
+        return round(1 + self.get_room_entry_exit_increase_decrease(), 2)
+
+    # 本日の入退室数と昨日の入退室数との増減率（(本日 - 昨日) / 昨日）
+    # 入退室数の履歴がある場合は、前日の合計と比較する
+    def get_room_entry_exit_increase_decrease(self):
+        today = self.get_today_room_entry_exit_count()
+        change = self.get_baseline_change("room", today)
+        if change is not None:
+            return change
+        yesterday = self.today_room_move_df.at[0, "昨日の入退室数"]
+        return (today - yesterday) / yesterday
 
     # 本日の移動距離を取得
     def get_today_movement_distance(self):
@@ -153,23 +1035,36 @@ class HealthData:
 
     # 本日の移動距離の内訳データを取得
     def get_movement_distance_breakdown(self):
-        return self.bet_in_out_distance_df.copy()
+        return self.view("bet_in_out_distance_df")
 
     # 入退室の多い日・時刻データを取得
     def get_weekly_room_entry_exit(self):
-        df = self.week_room_in_out_df.copy()
-        # df["日付"] = pd.to_datetime(df["日付"]).dt.strftime("%-m/%-d")
-        df["日付"] = pd.to_datetime(df["日付"],format="%Y-%m-%d").dt.strftime("%-m/%d")
-        df["日付_再調整"] = df["日付"]#.apply(lambda x: f"{x.month}月{x.day}日")
-        return df
+        return self.view("week_room_in_out_df", _room_labels)
 
     # 転倒検知した日、回数データを取得
     def get_fall_detection_data(self):
-        return self.fall_down_df.copy()
+        return self.view("fall_down_df")
+
+    # 異常検知のログを新しい順に取得
+    # start以上end未満の期間、危険度（severities）・アラート内容（kinds）の一覧で絞り込み、索引を使って検索する
+    # （Noneの条件では絞り込まない。limitを指定した場合はoffset行目からlimit行）
+    def get_alert_log(self, start=None, end=None, severities=None, kinds=None, limit=None, offset=0):
+        return read_alerts(self.data_dir).query(self.resident_id, start, end, severities, kinds, limit, offset)
 
-    # 異常検知ログデータを取得
-    def get_alert_log(self):
-        return self.alert_log_df.copy()
+    # 異常検知のログの絞り込みの選択肢 (最も古い時刻, 最も新しい時刻, 危険度の一覧, アラート内容の一覧) を取得
+    def get_alert_filters(self):
+        return read_alerts(self.data_dir).filters(self.resident_id)
+
+    # 異常検知のログのうち条件に合う行を新しい順に並べたときの、page番目（0始まり）のページを取得
+    # start・endは日付（endの日を含む）、severities・kindsは危険度・アラート内容の一覧（Noneの場合は絞り込まない）
+    def get_alert_page(self, page=0, page_size=100, start=None, end=None, severities=None, kinds=None):
+        start, end = _day_range(start, end)
+        return self.get_alert_log(start, end, severities, kinds, limit=page_size, offset=page * page_size)
+
+    # 異常検知のログのうち条件に合う行数を取得（条件はget_alert_pageと同じ）
+    def count_alerts(self, start=None, end=None, severities=None, kinds=None):
+        start, end = _day_range(start, end)
+        return read_alerts(self.data_dir).count(self.resident_id, start, end, severities, kinds)
 
     # 本日の行動記録
     def today_move_log(self):
@@ -197,32 +1092,106 @@ class HealthData:
     
     # 施設での過ごされ方のレコード
     def record(self):
-        return self.record_df
+        return self.view("record_df")
     
     # 睡眠時間、室内、室外
     def sleep_and_active_heatmap(self):
-        return self.sleep_and_active_heatmap_df
+        return self.view("sleep_and_active_heatmap_df", _sleep_active_heatmap_labels)
+
+    # 日×24時間の在室状況（カテゴリー番号と時間帯ごとの分の配列）を取得（データがなければNone）
+    def get_occupancy_grid(self):
+        grids = read_derived("sleep_active_heatmap", self.data_dir, occupancy.build_grids)
+        return occupancy.for_resident(grids, self.resident_id)
+
+    # 日ごとの外出・就寝・ベッド内・部屋内の内訳を取得（データがなければNone）
+    def get_minute_breakdown(self):
+        breakdowns = read_derived("donut_chart", self.data_dir, occupancy.build_breakdowns)
+        return occupancy.for_resident(breakdowns, self.resident_id)
     
     # 睡眠時間と活動時間の推移
     def past_week_sleep_time(self):
-        return self.past_week_sleep_time_df
+        return self.view("past_week_sleep_time_df", _past_week_labels)
     
     # レーダーチャート
     def rader_chart(self):
-        return self.rader_chart_df
+        return self.view("rader_chart_df")
     
     # ドーナツチャート
     def donut_chart(self):
-        return self.donut_chart_df
+        return self.view("donut_chart_df")
     
     # 起床時間、活動時間
     def today_wakeup_active_time(self):
-        return self.today_wakeup_active_time_df
+        return self.view("today_wakeup_active_time_df")
     
     # スタッフ用ページのバイタルデータ
     def staff_vital(self):
-        return self.staff_vital_df
+        return self.view("staff_vital_df")
     
     # よく眠れている日、そうでない日の可視化
     def month_sleep_roomout_heatmap(self):
-        return self.month_sleep_roomout_heatmap_df
\ No newline at end of file
+        return self.view("month_sleep_roomout_heatmap_df")
+
+
+def _day_range(start, end):
+    # 日付の範囲（endの日を含む）を、時刻の範囲 [start, end) にする
+    if start is not None:
+        start = pd.Timestamp(start).normalize()
+    if end is not None:
+        end = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    return start, end
+
+
+def _by_resident(df):
+    # 入居者IDの列がないデータは、既定の入居者のデータとして扱う
+    if RESIDENT_COLUMN in df.columns:
+        return df.assign(**{RESIDENT_COLUMN: df[RESIDENT_COLUMN].astype(str)})
+    return df.assign(**{RESIDENT_COLUMN: DEFAULT_RESIDENT})
+
+
+def _vitals_frame(resident_ids, times, heart, resp):
+    # 入居者ごとの最新のバイタルの配列を、入居者IDを索引にした心拍数・呼吸数のデータフレームにする
+    return pd.DataFrame(
+        {"心拍数": heart.astype("float64"), "呼吸数": resp.astype("float64")},
+        index=pd.Index(resident_ids, dtype=object, name=RESIDENT_COLUMN),
+    )
+
+
+def facility_overview(data_dir=None):
+    """
+    全入居者の現在の心拍数・呼吸数、最新のアラート、転倒回数を入居者ごとに1行で返す
+
+    入居者ごとにデータを読み込まず、施設全体のデータを一度に集計する。
+    """
+    facility = HealthData(data_dir, resident_id=None)
+    preload(facility.data_dir, ["realtime", "fall", "residents", "log"])
+
+    realtime = _by_resident(facility.dataset("real_time_df"))
+    overview = realtime.set_index(RESIDENT_COLUMN)[["リアルタイムの心拍数", "リアルタイムの呼吸数"]]
+    overview.columns = ["心拍数", "呼吸数"]
+
+    # 受信中または保存済みの高頻度のバイタルがある入居者は、その最新値で置き換える（受信中のデータを優先する）
+    latest = pd.concat([_vitals_frame(*facility.live.latest_all()), _vitals_frame(*facility.vitals.latest_all())])
+    latest = latest[~latest.index.duplicated()].round()
+    overview = latest.combine_first(overview)
+
+    # 入居者ごとの最新のアラート
+    latest_alerts = read_alerts(facility.data_dir).latest_per_resident()
+    latest_alerts = (
+        latest_alerts.fillna({RESIDENT_COLUMN: DEFAULT_RESIDENT})
+        .set_index(RESIDENT_COLUMN)[["時刻", "アラート内容", "危険度"]]
+    )
+    overview = overview.join(latest_alerts, how="outer")
+
+    # 入居者ごとの転倒回数
+    falls = _by_resident(facility.dataset("fall_down_df"))
+    overview["転倒回数"] = falls.groupby(RESIDENT_COLUMN)["転倒検知"].sum()
+    overview["転倒回数"] = overview["転倒回数"].fillna(0).astype(int)
+
+    # 入居者一覧があれば氏名・フロアを付ける
+    if has_source("residents", facility.data_dir):
+        residents = _by_resident(facility.dataset("residents_df")).set_index(RESIDENT_COLUMN)
+        overview = overview.join(residents[["氏名", "フロア"]], how="left")
+
+    overview.index.name = RESIDENT_COLUMN
+    return overview.reset_index()
@@ -0,0 +1,183 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 計測結果を1行1件のJSONで書き出すロガー
+# 環境変数 HEALTHDATA_TIMING_LOG にファイルを指定すると、そのファイルに書き出す
+logger = logging.getLogger("healthdata.timing")
+
+# Prometheus形式のヒストグラムの区切り（秒）
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 実行中のスクリプト（Streamlitはセッションごとに別スレッドで実行する）の計測結果
+_local = threading.local()
+
+# プロセス全体の集計 {(種類, 名前): {"count", "sum", "buckets"}}
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def configure_from_env():
+    """
+    環境変数 HEALTHDATA_TIMING_LOG が設定されていれば、計測結果をそのファイルに書き出す
+    """
+    path = os.environ.get("HEALTHDATA_TIMING_LOG")
+    if not path or logger.handlers:
+        return
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start_run(page):
+    """
+    スクリプトの実行の開始を記録する（以降の計測結果はこの実行の分として保持する）
+    """
+    _local.page = page
+    _local.started = time.perf_counter()
+    _local.records = []
+
+
+def records():
+    """
+    このスレッドで実行中のスクリプトの計測結果を記録順に返す
+    """
+    return list(getattr(_local, "records", []))
+
+
+# 実行中のスクリプトの計測の状態を表す属性
+_RUN_ATTRS = ("page", "started", "records")
+
+
+def bind(fn):
+    """
+    呼び出したスレッドで実行中のスクリプトの計測結果に、fnの計測結果も記録されるようにしたfnを返す
+
+    スレッドプールなど別のスレッドで実行する関数に使う（計測結果はスレッドごとに保持しているため）。
+    """
+    run = {attr: getattr(_local, attr) for attr in _RUN_ATTRS if hasattr(_local, attr)}
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        saved = {attr: getattr(_local, attr) for attr in _RUN_ATTRS if hasattr(_local, attr)}
+        for attr in _RUN_ATTRS:
+            if attr in run:
+                setattr(_local, attr, run[attr])
+            elif hasattr(_local, attr):
+                delattr(_local, attr)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for attr in _RUN_ATTRS:
+                if attr in saved:
+                    setattr(_local, attr, saved[attr])
+                elif hasattr(_local, attr):
+                    delattr(_local, attr)
+    return wrapper
+
+
+def elapsed():
+    """
+    このスレッドで実行中のスクリプトの開始からの経過時間（ミリ秒）を返す
+    """
+    started = getattr(_local, "started", None)
+    return None if started is None else (time.perf_counter() - started) * 1000
+
+
+def record(kind, name, seconds):
+    """
+    計測結果を1件記録する
+
+    kind: "load"（データソースの読み込み）, "accessor"（HealthDataのメソッド）,
+          "builder"（グラフの作成）, "emit"（グラフ・表の表示）, "engine"（異常検知）
+    """
+    entry = {"page": getattr(_local, "page", None), "kind": kind, "name": name, "ms": round(seconds * 1000, 3)}
+    if hasattr(_local, "records"):
+        _local.records.append(entry)
+
+    with _metrics_lock:
+        metric = _metrics.get((kind, name))
+        if metric is None:
+            metric = _metrics[(kind, name)] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)}
+        metric["count"] += 1
+        metric["sum"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                metric["buckets"][i] += 1
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"time": time.time(), **entry}, ensure_ascii=False))
+
+
+@contextmanager
+def timed(kind, name):
+    """
+    withブロックの実行時間を計測する
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, name, time.perf_counter() - start)
+
+
+def timer(kind, name=None):
+    """
+    関数の実行時間を計測するデコレータ（nameを省略した場合は関数名）
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(kind, label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_methods(kind, exclude=()):
+    """
+    クラスの公開メソッド（excludeを除く）すべての実行時間を計測するクラスデコレータ
+    """
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_") or attr in exclude or not callable(value):
+                continue
+            setattr(cls, attr, timer(kind, f"{cls.__name__}.{attr}")(value))
+        return cls
+    return decorator
+
+
+def metrics_text():
+    """
+    プロセス全体の計測結果をPrometheusのテキスト形式で返す
+    """
+    lines = [
+        "# HELP healthdata_duration_seconds Time spent loading data, running accessors, building and emitting charts.",
+        "# TYPE healthdata_duration_seconds histogram",
+    ]
+    with _metrics_lock:
+        metrics = {key: {**m, "buckets": list(m["buckets"])} for key, m in _metrics.items()}
+    for (kind, name), metric in sorted(metrics.items()):
+        labels = f'kind="{kind}",name="{_escape(name)}"'
+        for bound, count in zip(BUCKETS, metric["buckets"]):
+            lines.append(f'healthdata_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'healthdata_duration_seconds_bucket{{{labels},le="+Inf"}} {metric["count"]}')
+        lines.append(f"healthdata_duration_seconds_sum{{{labels}}} {metric['sum']:.6f}")
+        lines.append(f"healthdata_duration_seconds_count{{{labels}}} {metric['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    # Prometheusのラベル値のエスケープ
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+configure_from_env()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+# 入居者ごとに保持するサンプル数（5秒間隔で24時間分）
+CAPACITY = 24 * 60 * 60 // 5
+
+
+class RingBuffer:
+    """
+    入居者1人分の心拍数・呼吸数を新しい順にCAPACITY件まで保持するリングバッファ
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype="datetime64[s]")
+        self.heart = np.zeros(capacity, dtype=np.float32)
+        self.resp = np.zeros(capacity, dtype=np.float32)
+        # これまでに追加したサンプル数（書き込み位置と版を兼ねる）
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, sample_time, heart, resp):
+        i = self.count % self.capacity
+        self.time[i] = sample_time
+        self.heart[i] = heart
+        self.resp[i] = resp
+        self.count += 1
+
+    def latest(self):
+        """
+        最新の (時刻, 心拍数, 呼吸数) を返す（データがなければNone）
+        """
+        if self.count == 0:
+            return None
+        i = (self.count - 1) % self.capacity
+        return self.time[i], self.heart[i], self.resp[i]
+
+    def window(self, seconds):
+        """
+        最新のサンプルからseconds秒以内の (時刻, 心拍数, 呼吸数) を古い順に返す
+        """
+        n = len(self)
+        if n == 0:
+            return self.time[:0], self.heart[:0], self.resp[:0]
+        # 古い順に並べたときの位置を求める（リングの折り返しを考慮）
+        order = np.arange(self.count - n, self.count) % self.capacity
+        times = self.time[order]
+        start = np.searchsorted(times, times[-1] - np.timedelta64(seconds, "s"), side="left")
+        order = order[start:]
+        return self.time[order], self.heart[order], self.resp[order]
+
+
+class LiveFeed:
+    """
+    センサーから受け取ったバイタルを入居者ごとのリングバッファで保持する
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._buffers = {}
+
+    def add(self, resident_id, heart, resp, sample_time=None):
+        """
+        サンプルを1件追加する（sample_timeを省略した場合は現在時刻）
+
+        時刻は保存済みのデータと同じく、タイムゾーンなしのローカル時刻で扱う。
+        """
+        if sample_time is None:
+            sample_time = np.datetime64(pd.Timestamp.now().floor("s"))
+        with self._lock:
+            buffer = self._buffers.get(str(resident_id))
+            if buffer is None:
+                buffer = self._buffers[str(resident_id)] = RingBuffer(self.capacity)
+            buffer.append(np.datetime64(sample_time, "s"), heart, resp)
+
+    def residents(self):
+        with self._lock:
+            return list(self._buffers)
+
+    def latest(self, resident_id):
+        with self._lock:
+            buffer = self._buffers.get(str(resident_id))
+            return buffer.latest() if buffer is not None else None
+
+    def latest_all(self):
+        """
+        全入居者の最新のサンプルを (入居者ID, 時刻, 心拍数, 呼吸数) の配列で返す
+        """
+        with self._lock:
+            rows = [(resident_id, buffer.latest()) for resident_id, buffer in self._buffers.items()]
+        rows = [(resident_id, latest) for resident_id, latest in rows if latest is not None]
+        return (
+            [resident_id for resident_id, _ in rows],
+            np.array([latest[0] for _, latest in rows], dtype="datetime64[s]"),
+            np.array([latest[1] for _, latest in rows], dtype=np.float32),
+            np.array([latest[2] for _, latest in rows], dtype=np.float32),
+        )
+
+    def window(self, resident_id, seconds):
+        with self._lock:
+            buffer = self._buffers.get(str(resident_id))
+            return buffer.window(seconds) if buffer is not None else None
+
+    def version(self, resident_id):
+        """
+        入居者のデータの版（これまでに受け取ったサンプル数）を返す
+        """
+        with self._lock:
+            buffer = self._buffers.get(str(resident_id))
+            return buffer.count if buffer is not None else 0
+
+
+# プロセス全体で共有するフィード（HealthDataはここから最新値を読む）
+# バッファはダッシュボードのプロセス内にだけあるため、受信サーバーはダッシュボードのプロセスで起動する（serve_from_env）
+feed = LiveFeed()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    POST /samples : {"resident_id", "heart", "resp", "time"(任意, ISO 8601)} またはその配列を受け取る
+    GET /latest?resident=入居者ID : 最新のサンプルを返す
+    GET /metrics : 読み込み・グラフ作成などの計測結果をPrometheusのテキスト形式で返す
+    """
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/samples":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            samples = body if isinstance(body, list) else [body]
+            for sample in samples:
+                feed.add(sample["resident_id"], float(sample["heart"]), float(sample["resp"]), sample.get("time"))
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        self._send_json({"accepted": len(samples)})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._send(instrument.metrics_text().encode(), "text/plain; version=0.0.4")
+            return
+        if url.path != "/latest":
+            self.send_error(404)
+            return
+        resident_id = parse_qs(url.query).get("resident", [""])[0]
+        latest = feed.latest(resident_id)
+        if latest is None:
+            self.send_error(404, f"no samples for {resident_id!r}")
+            return
+        self._send_json({"resident_id": resident_id, "time": str(latest[0]), "heart": float(latest[1]), "resp": float(latest[2])})
+
+    def _send_json(self, payload):
+        self._send(json.dumps(payload).encode(), "application/json")
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # サンプルごとのアクセスログは出力しない
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port, host="127.0.0.1"):
+    """
+    受信サーバーをバックグラウンドのスレッドで起動する（起動済みの場合は何もしない）
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=_server.serve_forever, name="livefeed", daemon=True).start()
+        return _server
+
+
+def is_serving():
+    """
+    このプロセスで受信サーバーが起動しているかを返す
+    """
+    with _server_lock:
+        return _server is not None
+
+
+def serve_from_env():
+    """
+    環境変数 HEALTHDATA_LIVE_PORT が設定されていれば受信サーバーを起動する
+    """
+    port = os.environ.get("HEALTHDATA_LIVE_PORT")
+    if port:
+        serve(int(port))
+
+
+def simulate(url, residents, interval, count=None, seed=0):
+    """
+    センサーの代わりに、ランダムウォークするバイタルをinterval秒ごとに送信する
+    """
+    rng = np.random.default_rng(seed)
+    ids = [f"R{i + 1:04d}" for i in range(residents)]
+    heart = rng.normal(75, 8, residents)
+    resp = rng.normal(16, 2, residents)
+    sent = 0
+    while count is None or sent < count:
+        heart = np.clip(heart + rng.normal(0, 1.5, residents), 40, 160)
+        resp = np.clip(resp + rng.normal(0, 0.5, residents), 6, 40)
+        samples = [
+            {"resident_id": r, "heart": round(float(h), 1), "resp": round(float(b), 1)}
+            for r, h, b in zip(ids, heart, resp)
+        ]
+        request = urllib.request.Request(
+            url.rstrip("/") + "/samples",
+            data=json.dumps(samples).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request).close()
+        sent += 1
+        time.sleep(interval)
+
+
+# 受信の動作確認用シミュレーター（受信サーバーは HEALTHDATA_LIVE_PORT を設定したダッシュボードのプロセスで起動する）
+# 使い方: python livefeed.py --url http://127.0.0.1:8765 --residents 10 --interval 5
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--residents", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--count", type=int)
+    args = parser.parse_args()
+
+    simulate(args.url, args.residents, args.interval, args.count)
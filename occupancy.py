@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+# 入居者IDの列名（healthdata.RESIDENT_COLUMNと同じ）
+RESIDENT_COLUMN = "入居者ID"
+
+# 在室状況のカテゴリー（配列の値はこの並びの番号）
+CATEGORIES = ["就寝", "室内", "室外"]
+# データのない時間帯の値
+MISSING = np.iinfo(np.uint8).max
+
+# 時間帯ごとの分の列（CATEGORIESと同じ並び）
+MINUTE_COLUMNS = ["就寝（分）", "室内（分）（就寝除く）", "室外（分）"]
+
+HOURS = 24
+
+
+class OccupancyGrid:
+    """
+    入居者1人分の 日×24時間 の在室状況
+
+    dates: 日付（datetime64[D]、昇順）, codes: 時間帯ごとのカテゴリーの番号（uint8、日×24）,
+    minutes: 時間帯ごとのカテゴリー別の分（uint8、日×24×カテゴリー）
+    """
+
+    __slots__ = ("dates", "codes", "minutes")
+
+    def __init__(self, dates, codes, minutes):
+        self.dates = dates
+        self.codes = codes
+        self.minutes = minutes
+
+    def __len__(self):
+        return len(self.dates)
+
+    def labels(self, fmt="%-m/%-d"):
+        """
+        日付の表示用のラベルを返す
+        """
+        return pd.DatetimeIndex(self.dates).strftime(fmt)
+
+    def daily_minutes(self):
+        """
+        日ごとのカテゴリー別の分（日×カテゴリー）を返す
+        """
+        return self.minutes.sum(axis=1, dtype=np.int64)
+
+
+class MinuteBreakdown:
+    """
+    入居者1人分の日ごとの内訳（カテゴリー別の値）
+
+    dates: 日付（datetime64[D]、昇順）, categories: カテゴリー名, values: 日×カテゴリーの値（int64）
+    """
+
+    __slots__ = ("dates", "categories", "values")
+
+    def __init__(self, dates, categories, values):
+        self.dates = dates
+        self.categories = categories
+        self.values = values
+
+    def latest(self):
+        """
+        最新日の (カテゴリー名, 値) を返す
+        """
+        return list(self.categories), self.values[-1].tolist()
+
+
+def _index(df, date_column):
+    # 入居者・日付の番号と、入居者ごとの日付を求める（入居者IDの列がない場合は空文字列の入居者とする）
+    residents = df[RESIDENT_COLUMN].astype(str) if RESIDENT_COLUMN in df.columns else pd.Series("", index=df.index)
+    dates = df[date_column].to_numpy().astype("datetime64[D]")
+    keys = pd.MultiIndex.from_arrays([residents, dates]).unique().sort_values()
+    return residents, dates, keys
+
+
+def build_grids(df):
+    """
+    sleep_active_heatmapのデータから、入居者ごとのOccupancyGridを作る
+
+    入居者IDの列がない場合は、キーがNoneの1件だけを返す。
+    """
+    residents, dates, keys = _index(df, "最新の一ヶ月の日付")
+    grids = {}
+    position = keys.get_indexer(pd.MultiIndex.from_arrays([residents, dates]))
+    hours = df["時刻(hour)"].to_numpy() % HOURS
+    codes = pd.Categorical(df["カテゴリー"], categories=CATEGORIES).codes
+    all_codes = np.full((len(keys), HOURS), MISSING, dtype=np.uint8)
+    all_codes[position, hours] = np.where(codes < 0, MISSING, codes)
+    all_minutes = np.zeros((len(keys), HOURS, len(CATEGORIES)), dtype=np.uint8)
+    all_minutes[position, hours] = df[MINUTE_COLUMNS].to_numpy()
+
+    key_residents = keys.get_level_values(0)
+    key_dates = keys.get_level_values(1).to_numpy().astype("datetime64[D]")
+    for resident_id, rows in pd.Series(np.arange(len(keys))).groupby(key_residents.to_numpy()):
+        rows = rows.to_numpy()
+        grids[resident_id] = OccupancyGrid(key_dates[rows], all_codes[rows], all_minutes[rows])
+    return _normalize(grids)
+
+
+def build_breakdowns(df, value_column="外出"):
+    """
+    donut_chartのデータ（日付・カテゴリー・値）から、入居者ごとのMinuteBreakdownを作る
+    """
+    residents, dates, keys = _index(df, "日付")
+    categories = list(pd.unique(df["カテゴリー"]))
+    position = keys.get_indexer(pd.MultiIndex.from_arrays([residents, dates]))
+    values = np.zeros((len(keys), len(categories)), dtype=np.int64)
+    np.add.at(values, (position, pd.Categorical(df["カテゴリー"], categories=categories).codes), df[value_column].to_numpy())
+
+    key_residents = keys.get_level_values(0)
+    key_dates = keys.get_level_values(1).to_numpy().astype("datetime64[D]")
+    breakdowns = {}
+    for resident_id, rows in pd.Series(np.arange(len(keys))).groupby(key_residents.to_numpy()):
+        rows = rows.to_numpy()
+        breakdowns[resident_id] = MinuteBreakdown(key_dates[rows], categories, values[rows])
+    return _normalize(breakdowns)
+
+
+def _normalize(by_resident):
+    # 入居者IDの列がないデータはキーをNoneにする
+    return {k or None: v for k, v in by_resident.items()}
+
+
+def for_resident(by_resident, resident_id):
+    """
+    入居者のデータを返す（入居者IDの列がないデータは、どの入居者も同じデータを参照する）
+    """
+    if None in by_resident:
+        return by_resident[None]
+    return by_resident.get(str(resident_id))
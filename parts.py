@@ -1,7 +1,50 @@
+import os
+
 import streamlit as st
 import pandas as pd
 import graph
+import instrument
+import livefeed
+
+# リアルタイムの数値（心拍数・呼吸数など）だけを再描画する間隔（秒）
+LIVE_REFRESH_INTERVAL = 5
+
+
+# リアルタイムの数値を再描画する間隔を返す関数（受信サーバーが起動していない場合は値が変わらないため再描画しない）
+def live_refresh_interval():
+    return LIVE_REFRESH_INTERVAL if livefeed.is_serving() else None
+
+# グラフを表示する関数（表示にかかった時間をnameで計測する）
+# 空の図など同じ内容の図が並んでも区別できるよう、nameを要素のキーにする
+def plotly_chart(fig, name):
+    with instrument.timed("emit", name):
+        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False}, key=name)
+
+# 計測結果をサイドバーに表示する関数
+# URLに ?debug=1 を付けるか、環境変数 HEALTHDATA_DEBUG を設定した場合のみ表示する
+def debug_sidebar():
+    if not (os.environ.get("HEALTHDATA_DEBUG") or st.query_params.get("debug")):
+        return
+    records = pd.DataFrame(instrument.records(), columns=["kind", "name", "ms"])
+    with st.sidebar:
+        st.markdown("### 計測結果")
+        st.metric("スクリプトの実行時間", f"{instrument.elapsed() or 0:.0f} ms")
+        totals = records.groupby("kind")["ms"].sum().round(1)
+        st.dataframe(totals.rename("合計 (ms)"), use_container_width=True)
+        st.dataframe(records.sort_values("ms", ascending=False), use_container_width=True, hide_index=True)
 
+# 表示する入居者を確定する関数
+# 入居者ごとのデータで入居者IDの指定がない場合は最初の入居者を表示し、データにない入居者IDが指定された場合はエラーを表示して止める
+# 図のキャッシュの上限も入居者の数に合わせる
+def select_resident(data):
+    resident_ids = data.resident_ids()
+    graph.fit_figure_cache(max(len(resident_ids), 1))
+    if not resident_ids or data.resident_id in resident_ids:
+        return
+    if "resident" in st.query_params:
+        st.error(f"入居者ID「{data.resident_id}」のデータがありません")
+        st.stop()
+    data.resident_id = resident_ids[0]
 
 # ヘッダーを表示する関数
 def display_header(title, bg_color):
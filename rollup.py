@@ -0,0 +1,222 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 入居者IDの列名（healthdata.RESIDENT_COLUMNと同じ）
+RESIDENT_COLUMN = "入居者ID"
+
+# 週の区切り（日曜始まり）と月の区切り
+WEEKLY = "W-SAT"
+MONTHLY = "M"
+
+
+class DailyRollup:
+    """
+    入居者・日付（と任意の追加キー）ごとの集計値を保持する集計テーブル
+
+    aggregatesは {列名: "sum" または "first"} で、"sum"の列は日・週・月で足し合わせる。
+    新しいデータを受け取ったときは、内容が変わった日だけを集計し直す。
+    """
+
+    def __init__(self, date_column, aggregates, keys=()):
+        self.date_column = date_column
+        self.aggregates = aggregates
+        self.keys = list(keys)
+        self.table = None
+        self.partitioned = False
+        self._fingerprints = None
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    def _group_keys(self):
+        return [RESIDENT_COLUMN, self.date_column] + self.keys
+
+    def _aggregate(self, df):
+        return df.groupby(self._group_keys(), sort=False).agg(self.aggregates)
+
+    def _day_fingerprints(self, df):
+        # 行ごとのハッシュを日ごとに足し合わせ、日単位の内容の指紋にする
+        hashes = pd.util.hash_pandas_object(df, index=False)
+        return hashes.groupby([df[RESIDENT_COLUMN], df[self.date_column]]).sum()
+
+    def refresh(self, df, partitioned=True):
+        """
+        データ全体を受け取り、前回から内容が変わった日だけを集計し直す
+        """
+        fingerprints = self._day_fingerprints(df)
+        with self._lock:
+            self.partitioned = partitioned
+            if self.table is None:
+                self.table = self._aggregate(df).sort_index()
+            else:
+                previous = self._fingerprints
+                common = previous.index.intersection(fingerprints.index)
+                changed = common[previous[common].to_numpy() != fingerprints[common].to_numpy()]
+                added = fingerprints.index.difference(previous.index)
+                removed = previous.index.difference(fingerprints.index)
+                stale = changed.append(added).append(removed)
+                if len(stale):
+                    day_index = pd.MultiIndex.from_frame(df[[RESIDENT_COLUMN, self.date_column]])
+                    updated = self._aggregate(df[day_index.isin(changed.append(added))])
+                    keep = ~pd.MultiIndex.from_arrays(
+                        [self.table.index.get_level_values(0), self.table.index.get_level_values(1)]
+                    ).isin(stale)
+                    self.table = pd.concat([self.table[keep], updated]).sort_index()
+            self._fingerprints = fingerprints
+            self._grids.clear()
+
+    def append(self, df):
+        """
+        新しく追加された行だけを受け取り、集計値に足し込む
+        """
+        if df.empty:
+            return
+        with self._lock:
+            updated = self._aggregate(df)
+            if self.table is None:
+                self.table = updated.sort_index()
+            else:
+                sums = [c for c, how in self.aggregates.items() if how == "sum"]
+                firsts = [c for c, how in self.aggregates.items() if how == "first"]
+                table = self.table[sums].add(updated[sums], fill_value=0).astype(self.table[sums].dtypes)
+                if firsts:
+                    table = table.join(self.table[firsts].combine_first(updated[firsts]))
+                self.table = table[list(self.aggregates)].sort_index()
+            if self._fingerprints is not None:
+                # 指紋はハッシュの和（2の64乗で循環）なので、追加分を足し込めばよい
+                added = self._day_fingerprints(df)
+                index = self._fingerprints.index.union(added.index)
+                self._fingerprints = pd.Series(
+                    self._fingerprints.reindex(index, fill_value=0).to_numpy(dtype="uint64")
+                    + added.reindex(index, fill_value=0).to_numpy(dtype="uint64"),
+                    index=index,
+                )
+            self._grids.clear()
+
+    def daily(self, resident_id):
+        """
+        入居者の日ごとの集計値を返す
+        """
+        if self.partitioned:
+            key = str(resident_id)
+        else:
+            # 入居者IDの列がないデータソースは、どの入居者も同じ集計値を参照する
+            key = self.table.index.levels[0][0] if len(self.table) else None
+        try:
+            return self.table.xs(key, level=0)
+        except KeyError:
+            return self.table.iloc[0:0].droplevel(0)
+
+    def period(self, resident_id, freq):
+        """
+        入居者の週（WEEKLY）・月（MONTHLY）ごとの合計値を返す
+        """
+        sums = [c for c, how in self.aggregates.items() if how == "sum"]
+        daily = self.daily(resident_id)[sums]
+        dates = daily.index.get_level_values(self.date_column).to_period(freq).start_time
+        keys = [daily.index.get_level_values(k) for k in self.keys]
+        return daily.groupby([dates.rename(self.date_column)] + keys).sum()
+
+    def grid(self, resident_id, index, columns, value, label_format=None):
+        """
+        日ごとの集計値をindex×columnsの表（平均値）に並べ替えたものを返す
+
+        label_formatを指定すると、日時の行を表示用のラベルにする。
+        並べ替えた結果は次にデータが更新されるまで保持する。
+        """
+        key = (resident_id, index, columns, value, label_format)
+        with self._lock:
+            grid = self._grids.get(key)
+        if grid is None:
+            daily = self.daily(resident_id).reset_index()
+            # カテゴリー型の列は、この入居者のデータにある値だけを行・列にする
+            grid = daily.pivot_table(index=index, columns=columns, values=value, aggfunc="mean", observed=True)
+            if label_format is not None:
+                grid = grid.set_axis(grid.index.strftime(label_format))
+            with self._lock:
+                self._grids[key] = grid
+        return grid
+
+
+# 心拍数・呼吸数のヒストグラムの階級（1刻み）
+VITAL_BINS = 256
+
+
+class VitalRollup:
+    """
+    高頻度のバイタルから、入居者・日ごとの心拍数・呼吸数のヒストグラムを保持する集計
+
+    セグメントは追記のみのため、前回以降に追加されたサンプルだけをヒストグラムに足し込む。
+    週・月の統計量はヒストグラムを足し合わせて求める。
+    """
+
+    def __init__(self):
+        # {入居者ID: {日付: {"count", "heart", "resp"}}}
+        self._residents = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, store, resident_id):
+        """
+        入居者のセグメントのうち、新しく追加されたサンプルを集計に反映する
+
+        過去の日のセグメントは追記されないため、集計済みであれば読み直さない。
+        """
+        resident_id = str(resident_id)
+        days = store.days(resident_id)
+        with self._lock:
+            states = self._residents.setdefault(resident_id, {})
+            for day in days:
+                state = states.get(day)
+                if state is not None and day != days[-1]:
+                    continue
+                if state is None:
+                    state = states[day] = {
+                        "count": 0,
+                        "heart": np.zeros(VITAL_BINS, dtype=np.int64),
+                        "resp": np.zeros(VITAL_BINS, dtype=np.int64),
+                    }
+                segment = store.segment(resident_id, day)
+                if len(segment) <= state["count"]:
+                    continue
+                for name, values in (("heart", segment.heart), ("resp", segment.resp)):
+                    new = np.clip(np.rint(values[state["count"]:]), 0, VITAL_BINS - 1).astype(np.int64)
+                    state[name] += np.bincount(new, minlength=VITAL_BINS)
+                state["count"] = len(segment)
+
+    def stats(self, resident_id, freq=None):
+        """
+        入居者の心拍数・呼吸数の最小値・Q1・中央値・Q3・最大値を日（freq=None）・週・月ごとに返す
+        """
+        with self._lock:
+            states = {day: state for day, state in self._residents.get(str(resident_id), {}).items() if state["count"]}
+        if not states:
+            return None
+        days = sorted(states)
+        dates = pd.to_datetime(days)
+        periods = dates if freq is None else dates.to_period(freq).start_time
+
+        rows = []
+        for period in periods.unique():
+            members = [states[day] for day, p in zip(days, periods) if p == period]
+            row = {"日付": period}
+            for name, label in (("heart", "心拍数"), ("resp", "呼吸数")):
+                hist = np.sum([m[name] for m in members], axis=0)
+                row.update(_quantiles(hist, label))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def _quantiles(hist, label):
+    # ヒストグラムから最小値・四分位数・最大値を求める
+    cumulative = np.cumsum(hist)
+    total = cumulative[-1]
+    nonzero = np.flatnonzero(hist)
+    q1, median, q3 = np.searchsorted(cumulative, np.array([0.25, 0.5, 0.75]) * total, side="left")
+    return {
+        f"{label}最大値": nonzero[-1],
+        f"{label}Q1": q1,
+        f"{label}中央値": median,
+        f"{label}Q3": q3,
+        f"{label}最小値": nonzero[0],
+    }
@@ -0,0 +1,11 @@
+import sys
+
+from healthdata import compile_snapshots
+
+
+# data/*.csv を型付きのスナップショット（Parquet）に変換する
+# 使い方: python snapshot.py [データディレクトリ]
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    for path in compile_snapshots(data_dir):
+        print(path)
@@ -0,0 +1,388 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from healthdata import DATE_FORMATS, RESIDENT_COLUMN, SOURCES, VITALS_DIR
+from vitalstore import VitalStore
+
+WEEKDAYS = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
+WEEKDAYS_SHORT = ["月", "火", "水", "木", "金", "土", "日"]
+
+# アラートの種類ごとの (危険度, メッセージ)
+ALERTS = {
+    "転倒": [
+        ("危険", "居室で転倒を検知しました。至急対応してください。"),
+        ("危険", "浴室での転倒を検知しました。至急対応が必要です。"),
+        ("危険", "起床時に転倒を検知しました。対応をお願いします。"),
+    ],
+    "頻脈": [
+        ("危険", "心拍数が危険な値です。緊急対応が必要です。"),
+        ("注意", "心拍数がやや高めです。様子を見てください。"),
+        ("注意", "心拍数が上昇傾向です。体調を観察してください。"),
+    ],
+    "頻呼吸": [
+        ("注意", "呼吸数が高めです。体調を確認してください。"),
+        ("注意", "呼吸数が通常より多いです。体調確認をお願いします。"),
+    ],
+    "無呼吸": [
+        ("危険", "無呼吸状態を検知しました。至急確認が必要です。"),
+        ("危険", "短時間の無呼吸を検知しました。状態を確認してください。"),
+    ],
+    "夜中の移動": [
+        ("注意", "夜間の移動を検知しました。見守りをお願いします。"),
+        ("注意", "深夜に居室外への移動がありました。安全確認をお願いします。"),
+    ],
+}
+
+RECORDS = [
+    "本日は体調も良く、穏やかに過ごされました。",
+    "睡眠も深く、特に異常はありませんでした。",
+    "活動的に過ごされ、心拍数も安定していました。",
+    "睡眠時間も十分で、呼吸数も正常範囲でした。",
+    "日中は談話室で過ごされる時間が長くありました。",
+]
+
+RADER_CATEGORIES = ["睡眠リズム", "バイタルパターン", "睡眠時間", "活動時間"]
+
+# 何も指定しない場合の心拍数・呼吸数の間隔（秒）。サンプルデータと同じ1時間ごと
+DEFAULT_SAMPLE_RATE = 3600
+
+
+def resident_ids(residents):
+    """
+    合成データの入居者ID（R0001, R0002, ...）を返す
+    """
+    return [f"R{i + 1:04d}" for i in range(residents)]
+
+
+def _per_resident(ids, rows, columns):
+    # 入居者ごとにrows行ずつ並んだデータフレームを作る（columnsの値は入居者×行の順に並んだ配列）
+    df = pd.DataFrame({RESIDENT_COLUMN: np.repeat(ids, rows)})
+    for column, values in columns.items():
+        df[column] = np.asarray(values).reshape(-1) if np.ndim(values) else values
+    return df
+
+
+def _write(out_dir, source, df):
+    # DATE_FORMATSの書式で日時列を文字列にしてCSVに書き出す
+    for column, date_format in DATE_FORMATS.get(source, {}).items():
+        df[column] = pd.to_datetime(df[column]).dt.strftime(date_format)
+    df.to_csv(os.path.join(out_dir, SOURCES[source]), index=False)
+
+
+def _overlap(start, end, lo, hi):
+    # 区間 [start, end) と [lo, hi) の重なり（分）
+    return np.clip(np.minimum(end, hi) - np.maximum(start, lo), 0, None)
+
+
+def _clock(minutes):
+    # 0時からの分を "H:MM" にする
+    minutes = int(minutes) % (24 * 60)
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def _jp_clock(minutes):
+    # 0時からの分を "午前8:32分" の形にする
+    minutes = int(minutes) % (24 * 60)
+    hour, minute = divmod(minutes, 60)
+    half = "午前" if hour < 12 else "午後"
+    return f"{half}{hour % 12 if hour != 12 else 12}:{minute:02d}分"
+
+
+def _duration(minutes):
+    # 分を "6時間28分" の形にする
+    minutes = int(minutes)
+    return f"{minutes // 60}時間{minutes % 60}分"
+
+
+def _week_of_month(dates):
+    # 月の中で何週目か（月曜始まり、1日を含む週を1週目とする）
+    first = dates.to_period("M").start_time
+    return (dates.day - 1 + first.weekday) // 7 + 1
+
+
+class _Vitals:
+    """
+    入居者ごとの基準値に、日内変動とノイズを加えた心拍数・呼吸数のモデル
+    """
+
+    def __init__(self, rng, residents):
+        self.rng = rng
+        self.heart_base = rng.normal(75, 8, residents)
+        self.resp_base = rng.normal(16, 2, residents)
+        self.phase = rng.uniform(0, 2 * np.pi, residents)
+
+    def sample(self, seconds, resident=None):
+        """
+        時刻（1970年からの秒）に対する (心拍数, 呼吸数) を返す
+
+        residentを指定しない場合は 入居者×時刻 の配列を返す。
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if resident is None:
+            heart_base, resp_base, phase = (a[:, None] for a in (self.heart_base, self.resp_base, self.phase))
+        else:
+            heart_base, resp_base, phase = self.heart_base[resident], self.resp_base[resident], self.phase[resident]
+        cycle = np.sin(2 * np.pi * seconds / 86400 + phase)
+        shape = np.broadcast_shapes(np.shape(cycle), np.shape(heart_base))
+        heart = heart_base + 8 * cycle + self.rng.normal(0, 3, shape)
+        resp = resp_base + 2 * cycle + self.rng.normal(0, 1, shape)
+        return np.clip(heart, 35, 180), np.clip(resp, 4, 45)
+
+
+def generate(out_dir, residents=1, days=30, end="2024-09-30", sample_rate=None, vital_days=0, seed=0):
+    """
+    HealthDataが読み込むすべてのデータソースと同じ形式の合成データをout_dirに書き出す
+
+    residents: 入居者数、days: 日付のあるデータソースの日数（endまで）
+    sample_rate: 本日の心拍数・呼吸数（todayheart.csv）と高頻度のバイタルの間隔（秒）
+    vital_days: 高頻度のバイタル（vitals/）を書き出す日数（0の場合は書き出さない）
+    seedが同じであれば、同じ内容のデータを作成する。
+    """
+    rng = np.random.default_rng(seed)
+    sample_rate = sample_rate or DEFAULT_SAMPLE_RATE
+    os.makedirs(out_dir, exist_ok=True)
+
+    ids = resident_ids(residents)
+    dates = pd.date_range(end=pd.Timestamp(end), periods=days, freq="D")
+    today = dates[-1]
+    vitals = _Vitals(rng, residents)
+
+    # 入居者×日ごとの起床・就寝・外出の時刻（0時からの分）
+    shape = (residents, days)
+    wake = np.clip(rng.normal(390, 30, shape), 270, 540).round()
+    bed = np.clip(rng.normal(1350, 40, shape), 1200, 1530).round()
+    out_start = wake + rng.uniform(60, 180, shape).round()
+    out_end = np.minimum(out_start + rng.uniform(60, 600, shape).round(), bed - 30)
+    sleep_total = wake + np.clip(1440 - bed, 0, None)
+    out_total = np.clip(out_end - out_start, 0, None)
+
+    # 時間帯ごとの就寝・室外・室内の分
+    hours = np.arange(24) * 60
+    lo, hi = hours[None, None, :], hours[None, None, :] + 60
+    sleep_minutes = _overlap(0, wake[..., None], lo, hi) + _overlap(bed[..., None], 1440, lo, hi)
+    out_minutes = _overlap(out_start[..., None], out_end[..., None], lo, hi)
+    in_minutes = 60 - sleep_minutes - out_minutes
+
+    day_columns = {"日付": np.tile(dates, residents)}
+    weekdays = np.tile([WEEKDAYS[d] for d in dates.weekday], residents)
+    weeks = np.tile(_week_of_month(dates), residents)
+
+    _write(out_dir, "month_sleep_roomout_heatmap", _per_resident(ids, days, {
+        **day_columns,
+        "日": np.tile(dates.day, residents),
+        "睡眠時間": sleep_total.astype(int),
+        "室外時間": out_total.astype(int),
+        "週目": [f"{w}w" for w in weeks],
+        "曜日": weekdays,
+    }))
+    _write(out_dir, "week_sleep", _per_resident(ids, days, {
+        **day_columns,
+        "曜日": weekdays,
+        "週目": [f"第{w}週目" for w in weeks],
+        "睡眠時間": (sleep_total / 60).round().astype(int),
+        "活動時間": (out_total / 60).round().astype(int),
+    }))
+    _write(out_dir, "fall", _per_resident(ids, days, {
+        **day_columns,
+        "曜日": weekdays,
+        "週目": [f"{w}w" for w in weeks],
+        "転倒検知": rng.poisson(0.3, shape),
+    }))
+
+    # 時間帯ごとのデータ
+    categories = np.stack([sleep_minutes, in_minutes, out_minutes]).argmax(axis=0)
+    _write(out_dir, "sleep_active_heatmap", _per_resident(ids, days * 24, {
+        "最新の一ヶ月の日付": np.tile(np.repeat(dates, 24), residents),
+        "時刻(hour)": np.tile(np.arange(24), residents * days),
+        "就寝（分）": sleep_minutes.astype(int),
+        "室内（分）（就寝除く）": in_minutes.astype(int),
+        "室外（分）": out_minutes.astype(int),
+        "カテゴリー": np.array(["就寝", "室内", "室外"])[categories],
+        "カテゴリー数": categories,
+    }))
+    # 入退室数の時刻は 24（0時台）, 1, ..., 23 の順
+    room_hours = np.r_[24, np.arange(1, 24)]
+    entries = rng.poisson(np.where(sleep_minutes >= 30, 0.2, 1.5))
+    _write(out_dir, "room", _per_resident(ids, days * 24, {
+        "日付": np.tile(np.repeat(dates, 24), residents),
+        "時刻": np.tile(room_hours, residents * days),
+        "入退室数": entries,
+    }))
+
+    # 直近1週間のデータ
+    week = min(days, 7)
+    week_dates = dates[-week:]
+    _write(out_dir, "past_week_sleep_time", _per_resident(ids, week, {
+        "最新の一週間分の日付": np.tile(week_dates, residents),
+        "睡眠時間": (sleep_total[:, -week:] / 60).round(1),
+        "寝た時刻": (np.tile(week_dates, residents) + pd.to_timedelta(bed[:, -week:].ravel(), unit="min")),
+        "活動時間（室外時間）": (out_total[:, -week:] / 60).round(1),
+        "起きた時刻": (np.tile(week_dates, residents) + pd.to_timedelta(wake[:, -week:].ravel(), unit="min")),
+    }))
+
+    # 直近1週間の心拍数・呼吸数の統計量（5分ごとの値から求める）
+    seconds = (week_dates.asi8 // 10**9)[:, None] + np.arange(0, 86400, 300)[None, :]
+    heart, resp = vitals.sample(seconds.ravel())
+    stats = {}
+    for label, values in (("心拍数", heart), ("呼吸数", resp)):
+        values = values.reshape(residents, week, -1)
+        q = np.percentile(values, [100, 25, 50, 75, 0], axis=2)
+        for name, v in zip(["最大値", "Q1", "中央値", "Q3", "最小値"], q):
+            stats[label + name] = v.round(2)
+    _write(out_dir, "todayheartmax", _per_resident(ids, week, {
+        "日付": np.tile(week_dates.strftime("%-m/%-d"), residents),
+        **stats,
+    }))
+    day_means = {label: v.reshape(residents, week, -1).mean(axis=2) for label, v in (("心拍数", heart), ("呼吸数", resp))}
+    yesterday = -2 if week > 1 else -1
+
+    # 本日の心拍数・呼吸数
+    times = np.arange(0, 86400, sample_rate)
+    heart, resp = vitals.sample(today.value // 10**9 + times)
+    labels = [
+        f"{t // 3600}:{t % 3600 // 60:02d}" if sample_rate % 60 == 0 else f"{t // 3600}:{t % 3600 // 60:02d}:{t % 60:02d}"
+        for t in times
+    ]
+    _write(out_dir, "todayheart", _per_resident(ids, len(times), {
+        "時間": np.tile(labels, residents),
+        "心拍数": heart.round().astype(int),
+        "呼吸数": resp.round().astype(int),
+    }))
+    _write(out_dir, "realtime", _per_resident(ids, 1, {
+        "リアルタイムの心拍数": heart[:, -1].round().astype(int),
+        "リアルタイムの呼吸数": resp[:, -1].round().astype(int),
+        "昨日の心拍数の平均": day_means["心拍数"][:, yesterday].round().astype(int),
+        "昨日の呼吸数の平均": day_means["呼吸数"][:, yesterday].round().astype(int),
+    }))
+    _write(out_dir, "staff_vital", _per_resident(ids, 1, {
+        "日時": today,
+        "今日の呼吸数": resp.mean(axis=1).round().astype(int),
+        "昨日の呼吸数": day_means["呼吸数"][:, yesterday].round().astype(int),
+        "今日の心拍数": heart.mean(axis=1).round().astype(int),
+        "昨日の心拍数": day_means["心拍数"][:, yesterday].round().astype(int),
+    }))
+
+    # 本日・昨日の睡眠と活動
+    prev = -2 if days > 1 else -1
+    _write(out_dir, "active", _per_resident(ids, 1, {
+        "本日の起床時間": [_clock(m) for m in wake[:, -1]],
+        "本日の就寝時間": [_clock(m) for m in bed[:, -1]],
+        "本日の睡眠時間": (sleep_total[:, -1] / 60).round(1),
+        "昨日の睡眠時間": (sleep_total[:, prev] / 60).round(1),
+        "本日の活動時間": (out_total[:, -1] / 60).round(1),
+        "昨日の活動時間": (out_total[:, prev] / 60).round(1),
+    }))
+    _write(out_dir, "family_sleep_active_time", _per_resident(ids, 1, {
+        "今日の活動時間": [_duration(m) for m in out_total[:, -1]],
+        "今日の睡眠時間": [_duration(m) for m in sleep_total[:, -1]],
+    }))
+    _write(out_dir, "today_wakeup_active_time", _per_resident(ids, 1, {
+        "最新の起床の時刻(hour)": (wake[:, -1] // 60).astype(int),
+        "最新の起床の分(minute)": (wake[:, -1] % 60).astype(int),
+        "活動時間(hour)": (out_total[:, -1] // 60).astype(int),
+        "活動時間(minute)": (out_total[:, -1] % 60).astype(int),
+        "最新の睡眠の時刻(hour)": (bed[:, -1] % 1440 // 60).astype(int),
+        "最新の睡眠の分(minute)": (bed[:, -1] % 60).astype(int),
+        "睡眠時間(hour)": (sleep_total[:, -1] // 60).astype(int),
+        "睡眠時間(minute)": (sleep_total[:, -1] % 60).astype(int),
+    }))
+    _write(out_dir, "today_move_log", _per_resident(ids, 1, {
+        "テキスト": [
+            f"{_jp_clock(w)}　起床されました。\n{_jp_clock(s)}　外出されました。\n"
+            f"{_jp_clock(e)}　自室に戻られました。\n{_jp_clock(b)}　ベッドに入られました。"
+            for w, s, e, b in zip(wake[:, -1], out_start[:, -1], out_end[:, -1], bed[:, -1])
+        ],
+    }))
+
+    # 本日の内訳（外出・就寝・ベッド内・部屋内の割合）
+    in_bed = rng.uniform(10, 60, residents).round()
+    minutes = np.stack([out_total[:, -1], sleep_total[:, -1], in_bed, 1440 - out_total[:, -1] - sleep_total[:, -1] - in_bed], axis=1)
+    _write(out_dir, "donut_chart", _per_resident(ids, 4, {
+        "日付": today,
+        "カテゴリー": np.tile(["外出", "就寝", "ベット内", "部屋内"], residents),
+        "外出": (minutes / 1440 * 100).round().astype(int),
+    }))
+
+    # 本日の移動距離と入退室数
+    bed_inside = (sleep_minutes[:, -1] * rng.uniform(0, 10, (residents, 24))).round().astype(int)
+    bed_outside = ((60 - sleep_minutes[:, -1]) * rng.uniform(0, 20, (residents, 24))).round().astype(int)
+    _write(out_dir, "todaymove", _per_resident(ids, 24, {
+        "時刻": np.tile([f"{h}:00" for h in range(24)], residents),
+        "ベッド内移動距離": bed_inside,
+        "ベッド外移動距離": bed_outside,
+    }))
+    distance = (bed_inside + bed_outside).sum(axis=1) // 100
+    _write(out_dir, "move", _per_resident(ids, 1, {
+        "本日の入退室数": entries[:, -1].sum(axis=1),
+        "本日の移動距離": distance,
+        "昨日の入退室数": entries[:, prev].sum(axis=1),
+        "昨日の移動距離": (distance * rng.uniform(0.7, 1.3, residents)).round().astype(int),
+    }))
+
+    # アラートのログ（入居者・日ごとに平均1件）
+    counts = rng.poisson(1.0, residents * days)
+    alert_day = np.repeat(np.tile(dates, residents), counts)
+    alert_resident = np.repeat(np.repeat(ids, days), counts)
+    kinds = rng.choice(list(ALERTS), len(alert_day))
+    picks = [ALERTS[k][i % len(ALERTS[k])] for k, i in zip(kinds, rng.integers(0, 6, len(alert_day)))]
+    log = pd.DataFrame({
+        RESIDENT_COLUMN: alert_resident,
+        "時刻": alert_day + pd.to_timedelta(rng.integers(0, 86400, len(alert_day)), unit="s"),
+        "アラート内容": kinds,
+        "危険度": [p[0] for p in picks],
+        "アラートメッセージ": [p[1] for p in picks],
+    }).sort_values([RESIDENT_COLUMN, "時刻"], kind="stable")
+    _write(out_dir, "log", log)
+
+    # 記録とテキスト
+    _write(out_dir, "record", _per_resident(ids, days, {
+        "お日にち": np.tile([f"{d.month}月{d.day}日（{WEEKDAYS_SHORT[d.weekday()]}）" for d in dates[::-1]], residents),
+        "テキスト": np.array(RECORDS)[rng.integers(0, len(RECORDS), residents * days)],
+    }))
+    change = ((sleep_total[:, -1] / sleep_total.mean(axis=1) - 1) * 100).round().astype(int)
+    _write(out_dir, "vitalpattern", _per_resident(ids, 1, {
+        "テキスト": [
+            f"バイタルパターンは良好な数値を示しています。睡眠時間は先月の平均と比べ{abs(c)}%ほど{'増加' if c >= 0 else '減少'}した様です。"
+            for c in change
+        ],
+    }))
+    _write(out_dir, "rader_chart", _per_resident(ids, len(RADER_CATEGORIES), {
+        "カテゴリー": np.tile(RADER_CATEGORIES, residents),
+        "スコア": rng.integers(1, 6, residents * len(RADER_CATEGORIES)),
+    }))
+    _write(out_dir, "residents", pd.DataFrame({
+        RESIDENT_COLUMN: ids,
+        "氏名": [f"入居者{i + 1}" for i in range(residents)],
+        "フロア": [f"{i % 5 + 1}F" for i in range(residents)],
+    }))
+
+    # 高頻度のバイタル（sample_rate秒ごと、直近vital_days日分）
+    if vital_days:
+        store = VitalStore(os.path.join(out_dir, VITALS_DIR))
+        if store.residents():
+            raise ValueError(f"{store.root} already contains vitals")
+        start = (today - pd.Timedelta(days=vital_days - 1)).value // 10**9
+        seconds = start + np.arange(0, vital_days * 86400, sample_rate)
+        for i, resident_id in enumerate(ids):
+            heart, resp = vitals.sample(seconds, resident=i)
+            store.append(resident_id, seconds.astype("datetime64[s]"), heart, resp)
+    return ids
+
+
+# HealthDataが読み込むすべてのデータソースの合成データの作成
+# 使い方: python synthetic.py 出力先 [--residents 50] [--days 365] [--sample-rate 5] [--vital-days 1] [--seed 0]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--residents", type=int, default=1)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--end", default="2024-09-30")
+    parser.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument("--vital-days", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.out_dir, args.residents, args.days, args.end, args.sample_rate, args.vital_days, args.seed)
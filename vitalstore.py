@@ -0,0 +1,175 @@
+import os
+import threading
+
+import numpy as np
+
+# 1日分のセグメントを構成する列とデータ型
+# 時刻は datetime64[s] の整数表現（秒）で保存する
+COLUMNS = {
+    "time": np.dtype("<i8"),
+    "heart": np.dtype("<f4"),
+    "resp": np.dtype("<f4"),
+}
+
+
+class VitalSegment:
+    """
+    入居者1人・1日分の心拍数・呼吸数の時系列
+
+    各列はファイルをメモリマップした配列で、スライスしてもコピーは発生しない。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        arrays = {name: _map(os.path.join(path, name + ".bin"), dtype) for name, dtype in COLUMNS.items()}
+        # 書き込み途中の行を読まないよう、最も短い列の長さに揃える
+        length = min(len(a) for a in arrays.values())
+        self.time = arrays["time"][:length].view("datetime64[s]")
+        self.heart = arrays["heart"][:length]
+        self.resp = arrays["resp"][:length]
+
+    def __len__(self):
+        return len(self.time)
+
+    def slice(self, start=None, end=None):
+        """
+        [start, end) の範囲の (時刻, 心拍数, 呼吸数) をビューで返す
+        """
+        lo = 0 if start is None else np.searchsorted(self.time, np.datetime64(start, "s"), side="left")
+        hi = len(self) if end is None else np.searchsorted(self.time, np.datetime64(end, "s"), side="left")
+        return self.time[lo:hi], self.heart[lo:hi], self.resp[lo:hi]
+
+    def resample(self, start=None, end=None, unit="m"):
+        """
+        [start, end) の範囲を unit（"m"なら1分）ごとの平均にまとめた (時刻, 心拍数, 呼吸数) を返す
+
+        表示用に点の数を抑えるためのもので、平均の計算に必要な分だけを読み込む（NaNは除いて平均する）。
+        """
+        time, heart, resp = self.slice(start, end)
+        bins = time.astype(f"datetime64[{unit}]")
+        if len(bins) == 0:
+            return bins, heart, resp
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        means = []
+        for values in (heart, resp):
+            valid = ~np.isnan(values)
+            total = np.add.reduceat(np.where(valid, values, 0).astype(np.float64), starts)
+            count = np.add.reduceat(valid.astype(np.int64), starts)
+            means.append(np.divide(total, count, out=np.full(len(starts), np.nan), where=count > 0))
+        return bins[starts], means[0], means[1]
+
+    def latest(self):
+        """
+        最新の (時刻, 心拍数, 呼吸数) を返す（データがなければNone）
+        """
+        if len(self) == 0:
+            return None
+        return self.time[-1], self.heart[-1], self.resp[-1]
+
+
+class VitalStore:
+    """
+    心拍数・呼吸数の追記専用ストア
+
+    <root>/<入居者ID>/<YYYY-MM-DD>/{time,heart,resp}.bin に列ごとの生バイナリを追記する。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _segment_dir(self, resident_id, day):
+        return os.path.join(self.root, str(resident_id), str(day))
+
+    def residents(self):
+        """
+        データのある入居者IDを返す
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def days(self, resident_id):
+        """
+        データのある日付（YYYY-MM-DD）を昇順で返す
+        """
+        path = os.path.join(self.root, str(resident_id))
+        if not os.path.isdir(path):
+            return []
+        return sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+
+    def segment(self, resident_id, day=None):
+        """
+        指定日（省略時は最新日）のセグメントを返す（データがなければNone）
+        """
+        if day is None:
+            days = self.days(resident_id)
+            if not days:
+                return None
+            day = days[-1]
+        path = self._segment_dir(resident_id, day)
+        if not os.path.isdir(path):
+            return None
+        return VitalSegment(path)
+
+    def latest_all(self):
+        """
+        全入居者の最新日の最新のサンプルを (入居者ID, 時刻, 心拍数, 呼吸数) の配列で返す
+
+        セグメントをメモリマップせず、列ごとのファイルの末尾の1件だけを読む。
+        """
+        ids, rows = [], []
+        for resident_id in self.residents():
+            days = self.days(resident_id)
+            row = _last_row(self._segment_dir(resident_id, days[-1])) if days else None
+            if row is not None:
+                ids.append(resident_id)
+                rows.append(row)
+        columns = [np.array([row[i] for row in rows], dtype=dtype) for i, dtype in enumerate(COLUMNS.values())]
+        return ids, columns[0].view("datetime64[s]"), columns[1], columns[2]
+
+    def append(self, resident_id, times, heart, resp):
+        """
+        サンプルを日付ごとのセグメントに追記する（時刻は昇順であること）
+        """
+        times = np.asarray(times, dtype="datetime64[s]")
+        heart = np.asarray(heart, dtype=COLUMNS["heart"])
+        resp = np.asarray(resp, dtype=COLUMNS["resp"])
+        days = times.astype("datetime64[D]")
+
+        with self._lock:
+            for day in np.unique(days):
+                mask = days == day
+                path = self._segment_dir(resident_id, day)
+                os.makedirs(path, exist_ok=True)
+
+                last = VitalSegment(path).latest()
+                if last is not None and times[mask][0] <= last[0]:
+                    raise ValueError(f"samples must be newer than {last[0]} ({resident_id}, {day})")
+
+                # 時刻列を最後に書き込み、読み込み側が未完成の行を参照しないようにする
+                for name, values in (("heart", heart[mask]), ("resp", resp[mask]), ("time", times[mask].astype(COLUMNS["time"]))):
+                    with open(os.path.join(path, name + ".bin"), "ab") as f:
+                        f.write(values.astype(COLUMNS[name], copy=False).tobytes())
+
+
+def _last_row(path):
+    # セグメントの最後の行の (時刻, 心拍数, 呼吸数) を読む（書き込み途中の行は読まない。行がなければNone）
+    paths = {name: os.path.join(path, name + ".bin") for name in COLUMNS}
+    sizes = {name: os.path.getsize(p) if os.path.exists(p) else 0 for name, p in paths.items()}
+    length = min(sizes[name] // dtype.itemsize for name, dtype in COLUMNS.items())
+    if length == 0:
+        return None
+    row = []
+    for name, dtype in COLUMNS.items():
+        with open(paths[name], "rb") as f:
+            f.seek((length - 1) * dtype.itemsize)
+            row.append(np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0])
+    return tuple(row)
+
+
+def _map(path, dtype):
+    # 空のファイルはメモリマップできないため空配列を返す
+    if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(os.path.getsize(path) // dtype.itemsize,))